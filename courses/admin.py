@@ -1,13 +1,25 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html
-from django.utils import timezone
 from .models import (
-    Course, Lesson, StudentProfile, LessonProgress,
+    Course, Lesson, StudentProfile, LessonProgress, CourseProgress,
     Test, TestQuestion, TestChoiceOption, TestAttempt, TestAnswer,
-    Exam, ExamQuestion, ExamChoiceOption, ExamTextAnswer, ExamAttempt, ExamAnswer, RegistrationRequest
+    Exam, ExamQuestion, ExamChoiceOption, ExamTextAnswer, ExamAttempt, ExamAnswer, RegistrationRequest,
+    RegistrationBatchJob,
 )
+from . import registrations
+from .forms import StudentImportForm
+from .pagination import EstimatedCountPaginator
+from .progress import delete_views
+from .search import is_supported, make_prefix_query
+from .student_import import ImportFileError, import_students
 
 class StudentProfileInline(admin.StackedInline):
     model = StudentProfile
@@ -32,8 +44,38 @@ class LessonInline(admin.TabularInline):
         return "Нет изображения"
     image_preview.short_description = 'Предпросмотр'
 
+class FullTextSearchMixin:
+    """
+    Поиск в списке и автодополнении по GIN-индексу search_vector вместо
+    ILIKE по search_fields. Слова ищутся по началу, как и при ILIKE.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        query = make_prefix_query(search_term)
+        if query is None or not is_supported(self.model):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(search_vector=query), False
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Список по таблице с миллионами строк: число записей приблизительное,
+    без второго COUNT(*) по всей таблице при фильтрации.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+class AssessmentListFilter(admin.RelatedFieldListFilter):
+    """Фильтр по тесту или экзамену; в названии курс, поэтому выбираем его сразу."""
+
+    def field_choices(self, field, request, model_admin):
+        queryset = field.related_model._default_manager.select_related('course')
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return [(obj.pk, str(obj)) for obj in queryset]
+
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['title', 'lesson_count', 'created_at', 'updated_at']
     list_filter = ['created_at']
     search_fields = ['title', 'description']
@@ -49,9 +91,17 @@ class CourseAdmin(admin.ModelAdmin):
     )
     readonly_fields = ('created_at', 'updated_at', 'image_preview')
 
+    def get_queryset(self, request):
+        # Подзапрос, а не JOIN с GROUP BY: COUNT(*) для пагинации его отбрасывает
+        lessons = Lesson.objects.filter(course=OuterRef('pk')).order_by().values('course')
+        return super().get_queryset(request).annotate(
+            lesson_total=Coalesce(Subquery(lessons.annotate(total=Count('pk')).values('total')), 0),
+        )
+
     def lesson_count(self, obj):
-        return obj.lessons.count()
+        return obj.lesson_total
     lesson_count.short_description = 'Количество уроков'
+    lesson_count.admin_order_field = 'lesson_total'
 
     def image_preview(self, obj):
         if obj and obj.image:
@@ -60,7 +110,7 @@ class CourseAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Предпросмотр'
 
 @admin.register(Lesson)
-class LessonAdmin(admin.ModelAdmin):
+class LessonAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['title', 'course', 'order_num', 'has_video', 'created_at']
     list_filter = ['course', 'created_at']
     search_fields = ['title', 'content']
@@ -96,10 +146,26 @@ class StudentProfileAdmin(admin.ModelAdmin):
     fields = ['user', 'first_name', 'last_name', 'position']
     readonly_fields = ['user']
 @admin.register(LessonProgress)
-class LessonProgressAdmin(admin.ModelAdmin):
+class LessonProgressAdmin(LargeTableAdmin):
     list_display = ['user', 'lesson', 'viewed_at']
     list_filter = ['viewed_at', 'lesson__course']
+    list_select_related = ['user', 'lesson__course']
     search_fields = ['user__username', 'lesson__title']
+    autocomplete_fields = ['user', 'lesson']
+
+    def delete_model(self, request, obj):
+        delete_views(LessonProgress.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_views(queryset)
+
+@admin.register(CourseProgress)
+class CourseProgressAdmin(admin.ModelAdmin):
+    list_display = ['user', 'course', 'viewed_count', 'total_lessons', 'last_viewed_at']
+    list_filter = ['course']
+    list_select_related = ['user', 'course']
+    search_fields = ['user__username', 'course__title']
+    readonly_fields = ['user', 'course', 'viewed_count', 'total_lessons', 'last_viewed_at']
 
 # ----- Тесты -----
 class TestChoiceOptionInline(admin.TabularInline):
@@ -114,27 +180,46 @@ class TestQuestionInline(admin.TabularInline):
 
 @admin.register(Test)
 class TestAdmin(admin.ModelAdmin):
-    list_display = ['title', 'course', 'passing_score', 'created_at']
+    list_display = ['title', 'course', 'question_count', 'max_score', 'passing_score', 'created_at']
     list_filter = ['course']
     search_fields = ['title', 'description']
     inlines = [TestQuestionInline]
 
 @admin.register(TestQuestion)
-class TestQuestionAdmin(admin.ModelAdmin):
+class TestQuestionAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['__str__', 'test', 'points', 'order']
-    list_filter = ['test']
+    list_filter = [('test', AssessmentListFilter)]
+    list_select_related = ['test__course']
+    search_fields = ['text']
     inlines = [TestChoiceOptionInline]
 
 @admin.register(TestAttempt)
-class TestAttemptAdmin(admin.ModelAdmin):
+class TestAttemptAdmin(LargeTableAdmin):
     list_display = ['user', 'test', 'started_at', 'completed_at', 'score', 'passed']
-    list_filter = ['test', 'passed']
+    list_filter = [('test', AssessmentListFilter), 'passed']
+    list_select_related = ['user', 'test__course']
     search_fields = ['user__username']
+    autocomplete_fields = ['user', 'test']
+
+class AnswerAdmin(LargeTableAdmin):
+    """
+    Ответы на тесты и экзамены. В форме вместо всех вариантов ответов в
+    системе - только варианты вопроса ответа (при добавлении - после
+    сохранения ответа с вопросом).
+    """
+    autocomplete_fields = ['attempt', 'question']
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        field = form.base_fields.get('selected_options')
+        if field is not None:
+            field.queryset = field.queryset.filter(question_id=obj.question_id) if obj else field.queryset.none()
+        return form
 
 @admin.register(TestAnswer)
-class TestAnswerAdmin(admin.ModelAdmin):
+class TestAnswerAdmin(AnswerAdmin):
     list_display = ['attempt', 'question']
-    filter_horizontal = ['selected_options']
+    list_select_related = ['attempt__user', 'attempt__test', 'question']
 
 # ----- Экзамены -----
 class ExamChoiceOptionInline(admin.TabularInline):
@@ -153,26 +238,31 @@ class ExamQuestionInline(admin.TabularInline):
 
 @admin.register(Exam)
 class ExamAdmin(admin.ModelAdmin):
-    list_display = ['title', 'course', 'passing_score', 'allow_retake', 'created_at']
+    list_display = ['title', 'course', 'question_count', 'max_score', 'passing_score', 'allow_retake', 'created_at']
     list_filter = ['course']
     search_fields = ['title', 'description']
     inlines = [ExamQuestionInline]
 
 @admin.register(ExamQuestion)
-class ExamQuestionAdmin(admin.ModelAdmin):
+class ExamQuestionAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['__str__', 'exam', 'type', 'points', 'order']
-    list_filter = ['exam', 'type']
+    list_filter = [('exam', AssessmentListFilter), 'type']
+    list_select_related = ['exam__course']
+    search_fields = ['text']
     inlines = [ExamChoiceOptionInline, ExamTextAnswerInline]
 
 @admin.register(ExamAttempt)
-class ExamAttemptAdmin(admin.ModelAdmin):
+class ExamAttemptAdmin(LargeTableAdmin):
     list_display = ['user', 'exam', 'started_at', 'completed_at', 'score', 'passed']
-    list_filter = ['exam', 'passed']
+    list_filter = [('exam', AssessmentListFilter), 'passed']
+    list_select_related = ['user', 'exam__course']
+    search_fields = ['user__username']
+    autocomplete_fields = ['user', 'exam']
 
 @admin.register(ExamAnswer)
-class ExamAnswerAdmin(admin.ModelAdmin):
+class ExamAnswerAdmin(AnswerAdmin):
     list_display = ['attempt', 'question', 'text_answer']
-    filter_horizontal = ['selected_options']
+    list_select_related = ['attempt__user', 'attempt__exam', 'question']
 
 # Добавили запрос регистрации
 @admin.register(RegistrationRequest)
@@ -181,26 +271,89 @@ class RegistrationRequestAdmin(admin.ModelAdmin):
     list_filter = ['status']
     search_fields = ['user__username', 'user__email']
     actions = ['approve_requests', 'reject_requests']
+    change_list_template = 'admin/courses/registrationrequest/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='courses_registrationrequest_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """Импорт студентов из файла (см. student_import); заявки затем одобряются как обычно."""
+        if not request.user.has_perm('auth.add_user'):
+            raise PermissionDenied
+        result = None
+        form = StudentImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = import_students(
+                    upload.read(), upload.name, dry_run=form.cleaned_data['dry_run'],
+                    # Пароли хэшируются в запросе: большие файлы - командой import_students
+                    max_rows=settings.STUDENT_IMPORT_ADMIN_MAX_ROWS,
+                )
+            except ImportFileError as error:
+                form.add_error('file', str(error))
+        return TemplateResponse(request, 'admin/courses/registrationrequest/import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт студентов',
+            'form': form,
+            'result': result,
+            'max_rows': settings.STUDENT_IMPORT_ADMIN_MAX_ROWS,
+            'dry_run': form.is_bound and form.cleaned_data.get('dry_run'),
+        })
+
+    def review(self, request, queryset, action):
+        # Большие выборки (например, все заявки после набора) - фоновым заданием
+        selected = queryset.count()
+        if selected > settings.REGISTRATION_BULK_SYNC_LIMIT:
+            job = registrations.queue_job(action, queryset, request.user)
+            url = reverse('admin:courses_registrationbatchjob_change', args=[job.pk])
+            self.message_user(request, format_html(
+                'Выбрано {} заявок, обработка идёт в фоне: <a href="{}">задание №{}</a>.', selected, url, job.pk,
+            ))
+            return None
+        return registrations.ACTIONS[action](queryset), selected
 
     def approve_requests(self, request, queryset):
-        for reg_request in queryset.filter(status='pending'):
-            user = reg_request.user
-            user.is_active = True
-            user.save()
-            reg_request.status = 'approved'
-            reg_request.reviewed_at = timezone.now()
-            reg_request.save()
-        self.message_user(request, f"Одобрено {queryset.count()} заявок.")
+        result = self.review(request, queryset, 'approve')
+        if result:
+            approved, selected = result
+            self.message_user(request, f"Одобрено {approved} заявок, пропущено уже рассмотренных: {selected - approved}.")
     approve_requests.short_description = "Одобрить выбранные заявки"
 
     def reject_requests(self, request, queryset):
-        for reg_request in queryset.filter(status='pending'):
-            user = reg_request.user
-            # Можно просто удалить пользователя или отметить как отклонённого
-            user.delete()  # удаляем пользователя, заявка удалится каскадно
-        self.message_user(request, f"Отклонено {queryset.count()} заявок (пользователи удалены).")
+        result = self.review(request, queryset, 'reject')
+        if result:
+            rejected, selected = result
+            self.message_user(
+                request,
+                f"Отклонено {rejected} заявок (пользователи удалены), пропущено уже рассмотренных: {selected - rejected}.",
+            )
     reject_requests.short_description = "Отклонить выбранные заявки (удалить пользователей)"
 
+@admin.register(RegistrationBatchJob)
+class RegistrationBatchJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'action', 'status', 'progress_display', 'changed', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['action', 'status']
+    readonly_fields = [
+        'action', 'status', 'progress_display', 'total', 'processed', 'changed', 'error',
+        'created_by', 'created_at', 'updated_at', 'finished_at',
+    ]
+    exclude = ['request_ids']
+
+    def progress_display(self, obj):
+        return f"{obj.progress()}% ({obj.processed} из {obj.total})"
+    progress_display.short_description = 'Прогресс'
+
+    def has_add_permission(self, request):
+        # Задания создаются действиями в списке заявок
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Перерегистрируем User с нашей админкой
 admin.site.unregister(User)
-admin.site.register(User, UserAdmin)
\ No newline at end of file
+admin.site.register(User, UserAdmin)
@@ -0,0 +1,114 @@
+"""
+Скомпилированные ключи ответов для тестов и экзаменов.
+
+Ключ собирается один раз на версию теста/экзамена и содержит для каждого
+вопроса допустимые и правильные варианты, нормализованные текстовые ответы
+и баллы. Проверка ответов по ключу не требует обращений к БД.
+"""
+
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db.models import F
+
+from .caching import VersionedLRUCache
+from .models import Test, TestQuestion, Exam, ExamQuestion
+
+
+def normalize_answer(text):
+    """Приводит текстовый ответ к виду для сравнения."""
+    return text.strip().lower()
+
+
+class QuestionKey(namedtuple('QuestionKey', ['type', 'points', 'option_ids', 'correct_ids', 'text_variants'])):
+    """Ключ одного вопроса. text_variants равен None, если эталона нет."""
+
+    __slots__ = ()
+
+    def is_correct(self, selected_ids=(), text=''):
+        if self.type == 'text':
+            return self.text_variants is not None and normalize_answer(text) in self.text_variants
+        return frozenset(selected_ids) == self.correct_ids
+
+    def points_for(self, selected_ids=(), text=''):
+        return self.points if self.is_correct(selected_ids, text) else 0
+
+
+class AnswerKey:
+    """Ключ ответов теста или экзамена: вопросы в порядке вывода."""
+
+    def __init__(self, questions):
+        self.questions = questions
+        self.total_points = sum(question.points for question in questions.values())
+
+    def __contains__(self, question_id):
+        return question_id in self.questions
+
+    def __getitem__(self, question_id):
+        return self.questions[question_id]
+
+    def items(self):
+        return self.questions.items()
+
+
+def compile_test_key(test_id):
+    questions = OrderedDict()
+    for question in TestQuestion.objects.filter(test_id=test_id).prefetch_related('options'):
+        options = list(question.options.all())
+        questions[question.id] = QuestionKey(
+            type='choice',
+            points=question.points,
+            option_ids=frozenset(option.id for option in options),
+            correct_ids=frozenset(option.id for option in options if option.is_correct),
+            text_variants=None,
+        )
+    return AnswerKey(questions)
+
+
+def compile_exam_key(exam_id):
+    questions = OrderedDict()
+    queryset = ExamQuestion.objects.filter(exam_id=exam_id).prefetch_related('options', 'text_answers')
+    for question in queryset:
+        options = list(question.options.all())
+        # Как и раньше, эталоном служит первый текстовый ответ вопроса
+        text_answers = sorted(question.text_answers.all(), key=lambda answer: answer.pk)
+        text_variants = None
+        if text_answers:
+            text_variants = frozenset(
+                normalize_answer(variant) for variant in text_answers[0].correct_answer.split('|')
+            )
+        questions[question.id] = QuestionKey(
+            type=question.type,
+            points=question.points,
+            option_ids=frozenset(option.id for option in options),
+            correct_ids=frozenset(option.id for option in options if option.is_correct),
+            text_variants=text_variants,
+        )
+    return AnswerKey(questions)
+
+
+_cache = VersionedLRUCache(getattr(settings, 'ANSWER_KEY_CACHE_SIZE', 256))
+
+
+def get_test_key(test):
+    """Возвращает ключ ответов теста, собирая его при первом обращении к версии."""
+    return _cache.get_or_build(('test', test.pk), test.answer_key_version, lambda: compile_test_key(test.pk))
+
+
+def get_exam_key(exam):
+    """Возвращает ключ ответов экзамена, собирая его при первом обращении к версии."""
+    return _cache.get_or_build(('exam', exam.pk), exam.answer_key_version, lambda: compile_exam_key(exam.pk))
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def bump_test_version(**lookup):
+    """Инвалидирует ключи тестов, подходящих под lookup."""
+    Test.objects.filter(**lookup).update(answer_key_version=F('answer_key_version') + 1)
+
+
+def bump_exam_version(**lookup):
+    """Инвалидирует ключи экзаменов, подходящих под lookup."""
+    Exam.objects.filter(**lookup).update(answer_key_version=F('answer_key_version') + 1)
@@ -22,4 +22,8 @@ class CoursesConfig(AppConfig):
     name = 'courses'
 
     # Человеко-читаемое название приложения (для админки)
-    verbose_name = 'Управление курсами'
\ No newline at end of file
+    verbose_name = 'Управление курсами'
+
+    def ready(self):
+        # Регистрируем обработчики сигналов
+        from . import signals  # noqa: F401
@@ -0,0 +1,34 @@
+"""
+Вспомогательные функции для асинхронных представлений.
+
+Запросы к БД выполняются через асинхронный ORM (aget, async for), а
+синхронные части Django — ленивая загрузка request.user из сессии,
+отрисовка шаблонов с контекстными процессорами, запись в сессию —
+через sync_to_async, чтобы не блокировать цикл событий.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+
+
+arender = sync_to_async(render)
+
+
+def _load_user(request):
+    # Обращение к атрибуту загружает ленивый request.user из сессии и БД
+    request.user.is_authenticated
+    return request.user
+
+
+async def aget_user(request):
+    """Возвращает загруженный request.user; дальше он доступен без запросов."""
+    return await sync_to_async(_load_user)(request)
+
+
+async def aget_object_or_404(klass, *args, **kwargs):
+    queryset = klass._default_manager.all() if isinstance(klass, type) else klass
+    try:
+        return await queryset.aget(*args, **kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'{queryset.model._meta.object_name} не найден')
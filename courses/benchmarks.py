@@ -0,0 +1,390 @@
+"""
+Замеры представлений приложения courses на синтетических данных.
+
+Для каждого маршрута из courses/urls.py описан сценарий запроса (для форм -
+отдельно GET и POST). Данные создаёт команда create_test_data в нескольких
+масштабах; в каждом масштабе сценарии выполняются тестовым клиентом, и для
+каждого запроса записываются число SQL-запросов, время в БД и время
+рендеринга шаблонов (те же замеры, что у geology_education.metrics), а
+также общее время. Кэши перед каждым запросом очищаются, так что
+замеряется самый дорогой, «холодный» путь.
+
+Результаты сравниваются с бюджетами из benchmark_budgets.json. Кроме
+превышения бюджета ошибкой считается рост числа запросов с объёмом данных:
+это почти всегда запрос в цикле (N+1).
+"""
+
+import json
+import math
+import secrets
+import shutil
+import statistics
+import tempfile
+import time
+from collections import namedtuple
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Count
+from django.http import QueryDict
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from geology_education import metrics
+
+from . import answer_keys, outline, urls
+from .models import Course, CourseProgress, Exam
+from .progress import lesson_view_buffer
+from .submissions import submit_test, submit_exam
+
+
+BUDGETS_PATH = Path(__file__).with_name('benchmark_budgets.json')
+
+# Объём данных при масштабе 1; при масштабе k все значения умножаются на k
+BASE_SIZE = {
+    'users': 25,
+    'courses': 2,
+    'lessons_per_course': 5,
+    'questions': 3,
+    'attempts': 100,
+}
+PREFIX = 'bench'
+# Нижняя граница бюджета времени: быстрые ответы слишком чувствительны к шуму
+MIN_WALL_MS = 50
+PASSWORD = 'bench-Password-1'
+
+# Кэш и реплика на время замеров: данные создаются в незавершённой
+# транзакции, реплика их не видит
+BENCHMARK_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmarks'}},
+    'DATABASE_REPLICAS': [],
+    'LESSON_PROGRESS_FLUSH_INTERVAL': 0,
+    'SECURE_SSL_REDIRECT': False,
+    'ALLOWED_HOSTS': ['testserver'],
+}
+
+Measurement = namedtuple('Measurement', ['scenario', 'size', 'status', 'queries', 'db_ms', 'template_ms', 'wall_ms'])
+Scenario = namedtuple('Scenario', ['name', 'url_name', 'build'])
+
+SCENARIOS = []
+
+
+def scenario(name, url_name=None):
+    """
+    Регистрирует сценарий. Функция получает BenchmarkData и возвращает
+    (клиент, метод, путь, данные формы).
+    """
+    def register(build):
+        SCENARIOS.append(Scenario(name, url_name or name, build))
+        return build
+    return register
+
+
+def missing_scenarios():
+    """Имена маршрутов courses/urls.py, для которых нет сценария."""
+    covered = {item.url_name for item in SCENARIOS}
+    return sorted(pattern.name for pattern in urls.urlpatterns if pattern.name not in covered)
+
+
+class BenchmarkData:
+    """
+    Объекты сгенерированной базы, на которых выполняются сценарии: самый
+    популярный курс и самый активный студент этого курса.
+    """
+
+    def __init__(self, size):
+        last_course = Course.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        # Случайный префикс не пересекается с пользователями рабочей базы
+        self.prefix = f'{PREFIX}{secrets.token_hex(4)}_'
+        options = {name: value * size for name, value in BASE_SIZE.items()}
+        call_command(
+            'create_test_data', tests_per_course=1, exams_per_course=1, with_answers=True,
+            prefix=self.prefix, password=PASSWORD, stdout=StringIO(), **options,
+        )
+
+        self.course = (
+            Course.objects.filter(pk__gt=last_course)
+            .annotate(viewers=Count('progress')).order_by('-viewers', 'pk').first()
+        )
+        self.user = (
+            CourseProgress.objects.filter(course=self.course, user__is_active=True)
+            .select_related('user').order_by('-viewed_count', 'pk').first().user
+        )
+        self.lesson = self.course.lessons.order_by('order_num').first()
+        self.lesson.video_file.save('bench.mp4', ContentFile(b'\0' * 4096))
+        self.test = self.course.tests.order_by('pk').first()
+        # Иначе после сгенерированной попытки форма экзамена не откроется
+        Exam.objects.filter(course=self.course).update(allow_retake=True)
+        self.exam = self.course.exams.order_by('pk').first()
+
+        self.test_attempt = submit_test(self.user, self.test, self.answers(self.test.questions))
+        self.exam_attempt = submit_exam(self.user, self.exam, self.answers(self.exam.questions))
+
+        self.client = self.new_client(login=True)
+        self.staff = User.objects.create_user(f'{self.prefix}staff', is_staff=True)
+        self.registrations = 0
+
+    def new_client(self, login=False, user=None):
+        client = Client()
+        if login:
+            client.force_login(user or self.user)
+        return client
+
+    @staticmethod
+    def answers(questions):
+        """Ответы формы: первый вариант на каждый вопрос, для текстовых - слово."""
+        data = QueryDict(mutable=True)
+        for question in questions.prefetch_related('options'):
+            options = list(question.options.all())
+            data[f'question_{question.id}'] = str(options[0].id) if options else 'гранит'
+        return data
+
+
+@scenario('index')
+def index(data):
+    return data.client, 'get', reverse('courses:index'), None
+
+
+@scenario('course_list')
+def course_list(data):
+    return data.client, 'get', reverse('courses:course_list'), None
+
+
+@scenario('course_list_api')
+def course_list_api(data):
+    return data.client, 'get', reverse('courses:course_list_api') + '?' + urlencode({'limit': 50}), None
+
+
+@scenario('course_detail')
+def course_detail(data):
+    return data.client, 'get', reverse('courses:course_detail', args=[data.course.id]), None
+
+
+@scenario('lesson_detail')
+def lesson_detail(data):
+    return data.client, 'get', reverse('courses:lesson_detail', args=[data.course.id, data.lesson.id]), None
+
+
+@scenario('lesson_video')
+def lesson_video(data):
+    return data.client, 'get', reverse('courses:lesson_video', args=[data.course.id, data.lesson.id]), None
+
+
+@scenario('search')
+def search(data):
+    return data.client, 'get', reverse('courses:search') + '?' + urlencode({'q': 'гранит'}), None
+
+
+@scenario('register')
+def register(data):
+    return data.new_client(), 'get', reverse('courses:register'), None
+
+
+@scenario('register:post', 'register')
+def register_post(data):
+    data.registrations += 1
+    username = f'{data.prefix}new_{data.registrations}'
+    return data.new_client(), 'post', reverse('courses:register'), {
+        'username': username,
+        'first_name': 'Иван',
+        'last_name': 'Петров',
+        'position': 'Геолог',
+        'email': f'{username}@example.com',
+        'password1': PASSWORD,
+        'password2': PASSWORD,
+    }
+
+
+@scenario('login')
+def login(data):
+    return data.new_client(), 'get', reverse('courses:login'), None
+
+
+@scenario('login:post', 'login')
+def login_post(data):
+    return data.new_client(), 'post', reverse('courses:login'), {'username': data.user.username, 'password': PASSWORD}
+
+
+@scenario('logout')
+def logout(data):
+    return data.new_client(login=True), 'get', reverse('courses:logout'), None
+
+
+@scenario('my_courses')
+def my_courses(data):
+    return data.client, 'get', reverse('courses:my_courses'), None
+
+
+@scenario('test_list')
+def test_list(data):
+    return data.client, 'get', reverse('courses:test_list', args=[data.course.id]), None
+
+
+@scenario('test_detail')
+def test_detail(data):
+    return data.client, 'get', reverse('courses:test_detail', args=[data.course.id, data.test.id]), None
+
+
+@scenario('test_detail:post', 'test_detail')
+def test_detail_post(data):
+    url = reverse('courses:test_detail', args=[data.course.id, data.test.id])
+    return data.client, 'post', url, data.answers(data.test.questions)
+
+
+@scenario('test_result')
+def test_result(data):
+    url = reverse('courses:test_result', args=[data.course.id, data.test.id, data.test_attempt.id])
+    return data.client, 'get', url, None
+
+
+@scenario('exam_list')
+def exam_list(data):
+    return data.client, 'get', reverse('courses:exam_list', args=[data.course.id]), None
+
+
+@scenario('exam_detail')
+def exam_detail(data):
+    return data.client, 'get', reverse('courses:exam_detail', args=[data.course.id, data.exam.id]), None
+
+
+@scenario('exam_detail:post', 'exam_detail')
+def exam_detail_post(data):
+    url = reverse('courses:exam_detail', args=[data.course.id, data.exam.id])
+    return data.client, 'post', url, data.answers(data.exam.questions)
+
+
+@scenario('exam_result')
+def exam_result(data):
+    url = reverse('courses:exam_result', args=[data.course.id, data.exam.id, data.exam_attempt.id])
+    return data.client, 'get', url, None
+
+
+@scenario('metrics')
+def prometheus_metrics(data):
+    return data.new_client(login=True, user=data.staff), 'get', reverse('courses:metrics'), None
+
+
+def reset_caches():
+    cache.clear()
+    outline.clear_cache()
+    answer_keys.clear_cache()
+    # Просмотры из откатываемой транзакции не должны попасть в БД при выходе
+    lesson_view_buffer.clear()
+
+
+def measure(item, data, size):
+    client, method, path, form = item.build(data)
+    reset_caches()
+    # Те же замеры, что у performance_middleware: он продолжает начатые здесь,
+    # а сюда попадают и запросы при чтении потокового ответа
+    token = metrics.begin_request()
+    try:
+        started = time.perf_counter()
+        response = getattr(client, method)(path, form) if form is not None else getattr(client, method)(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        wall = time.perf_counter() - started
+    finally:
+        request_metrics = metrics.end_request(token)
+    return Measurement(
+        scenario=item.name,
+        size=size,
+        status=response.status_code,
+        queries=request_metrics.queries,
+        db_ms=request_metrics.db_seconds * 1000,
+        template_ms=request_metrics.template_seconds * 1000,
+        wall_ms=wall * 1000,
+    )
+
+
+def summarize(measurements):
+    """Сводка повторов одного сценария: максимум запросов, медианы времени."""
+    return measurements[0]._replace(
+        status=measurements[-1].status,
+        queries=max(item.queries for item in measurements),
+        db_ms=statistics.median(item.db_ms for item in measurements),
+        template_ms=statistics.median(item.template_ms for item in measurements),
+        wall_ms=statistics.median(item.wall_ms for item in measurements),
+    )
+
+
+def run(sizes, repeat=3, progress=None):
+    """
+    Выполняет все сценарии в каждом масштабе из sizes; возвращает список
+    Measurement (по одной сводке на сценарий и масштаб). Данные каждого
+    масштаба создаются в транзакции и откатываются.
+    """
+    missing = missing_scenarios()
+    if missing:
+        raise ValueError(f'Нет сценариев для маршрутов: {", ".join(missing)}')
+
+    results = []
+    media_root = tempfile.mkdtemp()
+    try:
+        with override_settings(MEDIA_ROOT=media_root, **BENCHMARK_SETTINGS):
+            for size in sizes:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    data = BenchmarkData(size)
+                    if progress:
+                        progress(f'Масштаб {size}: данные созданы за {time.perf_counter() - started:.1f} с')
+                    for item in SCENARIOS:
+                        results.append(summarize([measure(item, data, size) for _ in range(repeat)]))
+                    transaction.set_rollback(True)
+                reset_caches()
+    finally:
+        lesson_view_buffer.clear()
+        shutil.rmtree(media_root, ignore_errors=True)
+    return results
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path, encoding='utf-8') as budgets:
+        return json.load(budgets)
+
+
+def save_budgets(results, path=BUDGETS_PATH, headroom=2.0):
+    """Записывает бюджеты по результатам: запросы как есть, время с запасом headroom."""
+    budgets = {}
+    for item in results:
+        budget = budgets.setdefault(item.scenario, {'queries': 0, 'wall_ms': 0})
+        budget['queries'] = max(budget['queries'], item.queries)
+        budget['wall_ms'] = max(budget['wall_ms'], MIN_WALL_MS, math.ceil(item.wall_ms * headroom / 10) * 10)
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(budgets, output, ensure_ascii=False, indent=2, sort_keys=True)
+        output.write('\n')
+
+
+def check(results, budgets, check_time=True):
+    """Список нарушений: ошибки ответа, превышение бюджетов и рост числа запросов."""
+    problems = []
+    by_scenario = {}
+    for item in results:
+        by_scenario.setdefault(item.scenario, []).append(item)
+
+    for name, items in by_scenario.items():
+        budget = budgets.get(name)
+        if budget is None:
+            problems.append(f'{name}: нет бюджета')
+        for item in items:
+            if item.status >= 400:
+                problems.append(f'{name} (масштаб {item.size}): ответ {item.status}')
+            if budget is None:
+                continue
+            if item.queries > budget['queries']:
+                problems.append(f'{name} (масштаб {item.size}): {item.queries} запросов, бюджет {budget["queries"]}')
+            if check_time and item.wall_ms > budget['wall_ms']:
+                problems.append(f'{name} (масштаб {item.size}): {item.wall_ms:.0f} мс, бюджет {budget["wall_ms"]} мс')
+        smallest, largest = min(items, key=lambda item: item.size), max(items, key=lambda item: item.size)
+        if largest.queries > smallest.queries:
+            problems.append(
+                f'{name}: число запросов растёт с объёмом данных '
+                f'({smallest.queries} при масштабе {smallest.size}, {largest.queries} при масштабе {largest.size})'
+            )
+    return problems
@@ -0,0 +1,57 @@
+"""
+Кэши уровня процесса.
+
+Значения хранятся в памяти воркера вместе с версией, которую владелец
+данных увеличивает при каждом изменении. Версия читается из строки БД,
+которую представление загружает в любом случае, поэтому изменение сразу
+видно во всех воркерах gunicorn без общего кэша.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class VersionedLRUCache:
+    """
+    Потокобезопасный LRU-кэш с версиями записей.
+
+    Запись с устаревшей версией считается промахом и перезаписывается.
+    При превышении maxsize вытесняется запись, к которой дольше всего
+    не обращались.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._data[key] = (version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_build(self, key, version, builder):
+        value = self.get(key, version)
+        if value is None:
+            # Сборка выполняется вне блокировки: в худшем случае два потока
+            # соберут одно и то же значение, и сохранится последнее.
+            value = builder()
+            self.set(key, version, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
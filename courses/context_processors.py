@@ -1,13 +1,15 @@
+from .roles import get_user_roles
+
+
 def user_info(request):
     context = {
         'user': request.user,
     }
     if request.user.is_authenticated:
-        context['is_admin'] = (
-            request.user.is_superuser or
-            request.user.groups.filter(name='Администратор').exists()
-        )
-        context['is_student'] = request.user.groups.filter(name='Студент').exists()
-        if hasattr(request.user, 'student_profile'):
-            context['student_profile'] = request.user.student_profile
-    return context
\ No newline at end of file
+        # Роли и профиль берутся из кэша, см. roles.get_user_roles
+        roles = get_user_roles(request.user)
+        context['is_admin'] = roles.is_admin
+        context['is_student'] = roles.is_student
+        if roles.student_profile is not None:
+            context['student_profile'] = roles.student_profile
+    return context
@@ -7,8 +7,12 @@
 
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
 from functools import wraps
 
+from .async_utils import aget_user
+from .roles import get_user_roles
+
 
 def admin_required(view_func):
     """
@@ -25,19 +29,43 @@ def admin_required(view_func):
         # Проверяем, авторизован ли пользователь и является ли администратором
         if not request.user.is_authenticated:
             messages.error(request, 'Для доступа к этой странице необходимо войти.')
-            return redirect('login')
-
-        # Проверка на администратора
-        is_admin = (
-                request.user.is_superuser or
-                request.user.groups.filter(name='Администратор').exists()
-        )
+            return redirect('courses:login')
 
-        if not is_admin:
+        # Проверка на администратора (роль берётся из кэша, как и в шаблонах)
+        if not get_user_roles(request.user).is_admin:
             messages.error(request, 'У вас нет прав для доступа к этой странице.')
-            return redirect('index')
+            return redirect('courses:index')
 
         # Если все проверки пройдены, вызываем оригинальную функцию
         return view_func(request, *args, **kwargs)
 
-    return _wrapped_view
\ No newline at end of file
+    return _wrapped_view
+
+
+def alogin_required(view_func):
+    """
+    Аналог login_required для асинхронных представлений.
+
+    Пользователь загружается из сессии вне цикла событий; неавторизованный
+    отправляется на LOGIN_URL с параметром next.
+    """
+
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+
+    return _wrapped_view
+
+
+def replica_reads(view_func):
+    """
+    Помечает представление, которое только читает данные: при настроенной
+    реплике его запросы GET читают с неё (см. geology_education.db_router).
+    Запись в таком представлении допустима - после неё чтение до конца
+    запроса идёт из основной БД.
+    """
+    view_func.replica_reads = True
+    return view_func
@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from .models import StudentProfile
 
 class StudentRegistrationForm(forms.Form):
@@ -49,4 +50,19 @@ class StudentRegistrationForm(forms.Form):
         password2 = cleaned_data.get('password2')
         if password1 and password2 and password1 != password2:
             raise forms.ValidationError('Пароли не совпадают.')
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+class StudentImportRowForm(forms.Form):
+    """Строка файла импорта студентов (см. student_import); логин сверяется с базой отдельно."""
+
+    username = forms.CharField(label='Логин', max_length=150, validators=[UnicodeUsernameValidator()])
+    first_name = forms.CharField(label='Имя', max_length=100)
+    last_name = forms.CharField(label='Фамилия', max_length=100)
+    position = forms.CharField(label='Должность', max_length=200)
+    email = forms.EmailField(label='Email', required=False)
+    password = forms.CharField(label='Пароль')
+
+
+class StudentImportForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или XLSX')
+    dry_run = forms.BooleanField(label='Только проверить, ничего не создавая', required=False)
@@ -0,0 +1,117 @@
+"""
+Уменьшенные копии изображений курсов и уроков.
+
+После загрузки изображения для каждой ширины из IMAGE_VARIANT_WIDTHS
+один раз создаются копии в JPEG и WebP рядом с оригиналом
+(courses/rocks.png -> courses/rocks_png_320w.jpg, courses/rocks_png_320w.webp).
+Расширение оригинала входит в имя копии, поэтому rocks.png и rocks.jpg
+не перезаписывают копии друг друга. Список созданных ширин хранится в
+поле image_variants вместе с именем оригинала, поэтому шаблоны строят
+srcset без обращений к хранилищу. При замене или удалении изображения
+прежние копии удаляются.
+
+Прозрачность сохраняется в WebP; в JPEG прозрачные области заливаются
+белым.
+"""
+
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+logger = logging.getLogger(__name__)
+
+# Формат Pillow, расширение файла и параметры сохранения
+FORMATS = (
+    ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+)
+
+# Форматы с альфа-каналом
+ALPHA_FORMATS = {'WEBP'}
+
+
+def variant_name(name, width, ext):
+    root, source_ext = os.path.splitext(name)
+    if source_ext:
+        root = f'{root}_{source_ext[1:]}'
+    return f'{root}_{width}w.{ext}'
+
+
+def variant_widths(original_width):
+    """Ширины копий: настроенные, но не больше оригинала."""
+    return sorted({min(width, original_width) for width in settings.IMAGE_VARIANT_WIDTHS})
+
+
+def generate_variants(name, storage=default_storage):
+    """
+    Создаёт копии изображения name во всех ширинах и форматах.
+
+    Возвращает значение для поля image_variants или None, если файл не
+    удалось прочитать как изображение.
+    """
+    try:
+        with storage.open(name, 'rb') as f:
+            image = ImageOps.exif_transpose(Image.open(f))
+            has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Не удалось прочитать изображение %s', name, exc_info=True)
+        return None
+
+    widths = variant_widths(image.width)
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+        for image_format, ext, params in FORMATS:
+            output = resized
+            if has_alpha and image_format not in ALPHA_FORMATS:
+                output = Image.new('RGB', resized.size, 'white')
+                output.paste(resized, mask=resized.getchannel('A'))
+            buffer = BytesIO()
+            output.save(buffer, image_format, **params)
+            target = variant_name(name, width, ext)
+            # Имя копии детерминировано, поэтому старый файл заменяем
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+    return {'source': name, 'widths': widths}
+
+
+def current_variants(name, variants):
+    """Ширины копий, если они созданы для файла name, иначе пустой список."""
+    if not name or not variants or variants.get('source') != name:
+        return []
+    return variants['widths']
+
+
+def delete_variants(variants, storage=default_storage):
+    """Удаляет копии, перечисленные в значении поля image_variants."""
+    if not variants:
+        return
+    for width in variants['widths']:
+        for _, ext, _ in FORMATS:
+            storage.delete(variant_name(variants['source'], width, ext))
+
+
+def refresh_image_variants(instance, field='image', variants_field='image_variants'):
+    """
+    Создаёт копии, если изображение объекта сменилось, и сохраняет их
+    список; копии прежнего изображения удаляет.
+    """
+    field_file = getattr(instance, field)
+    old_variants = getattr(instance, variants_field)
+    if field_file:
+        if current_variants(field_file.name, old_variants):
+            return
+    elif not old_variants:
+        return
+    delete_variants(old_variants, field_file.storage)
+    variants = field_file and generate_variants(field_file.name, field_file.storage) or {}
+    setattr(instance, variants_field, variants)
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field: variants})
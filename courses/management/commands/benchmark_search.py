@@ -0,0 +1,122 @@
+"""
+Замер времени полнотекстового поиска на синтетическом корпусе уроков.
+
+Корпус создаётся внутри транзакции и по умолчанию откатывается, так что
+базу можно использовать рабочую (на копии данных). Для сравнения тот же
+набор запросов выполняется через ILIKE по содержанию урока.
+
+Использование:
+python manage.py benchmark_search
+python manage.py benchmark_search --lessons 100000 --repeat 5 --explain
+"""
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from courses.models import Course, Lesson
+from courses.search import is_supported, make_query, ranked, search, update_search_vectors
+from courses.synthetic import TextGenerator
+
+
+QUERIES = (
+    'гранит', 'осадочные породы', 'водоносный горизонт', 'разлом -сдвиг', '"рудное тело"',
+    'нефть газ коллектор', 'метаморфизм мрамора', 'юрские аммониты', 'каротаж скважины', 'ледниковая морена',
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    """
+    Создаёт N синтетических уроков и замеряет поиск по индексу и через ILIKE.
+    """
+
+    help = 'Замеряет полнотекстовый поиск на синтетическом корпусе уроков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lessons', type=int, default=100000, help='Размер корпуса (уроков)')
+        parser.add_argument('--words', type=int, default=120, help='Слов в содержании урока')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого запроса')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--explain', action='store_true', help='Вывести план первого запроса')
+        parser.add_argument('--keep', action='store_true', help='Не откатывать созданный корпус')
+
+    def handle(self, *args, **options):
+        if not is_supported(Lesson):
+            raise CommandError('Полнотекстовый поиск доступен только на PostgreSQL')
+
+        with transaction.atomic():
+            self.build_corpus(options)
+            self.run_benchmark(options)
+            if not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write('Корпус откачен')
+
+    def build_corpus(self, options):
+        texts = TextGenerator(random.Random(options['seed']))
+
+        started = time.perf_counter()
+        course = Course.objects.create(title='Синтетический корпус', description='Курс для замера поиска')
+        batch = []
+        for number in range(options['lessons']):
+            batch.append(Lesson(
+                course=course,
+                title=texts.title(),
+                content=texts.text(options['words']),
+                order_num=number,
+            ))
+            if len(batch) == 2000:
+                Lesson.objects.bulk_create(batch)
+                batch = []
+        Lesson.objects.bulk_create(batch)
+        # bulk_create не вызывает сигналов, векторы заполняем одним UPDATE
+        update_search_vectors(Lesson, course=course)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Lesson._meta.db_table}')
+        self.stdout.write(
+            f'Создано уроков: {options["lessons"]} за {time.perf_counter() - started:.1f} с'
+        )
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def run_benchmark(self, options):
+        repeat = options['repeat']
+        if options['explain']:
+            query = make_query(QUERIES[0])
+            self.stdout.write(ranked(Lesson.objects.all(), query, 'content')[:20].explain(analyze=True))
+
+        totals = {'index': [], 'search': [], 'ilike': []}
+        self.stdout.write(f'{"запрос":<24}{"индекс, мс":>12}{"search(), мс":>14}{"ILIKE, мс":>12}')
+        for text in QUERIES:
+            query = make_query(text)
+            word = text.strip('"-').split()[0]
+            row = {
+                'index': self.measure(lambda: list(ranked(Lesson.objects.all(), query, 'content')[:20]), repeat),
+                'search': self.measure(lambda: search(text), repeat),
+                'ilike': self.measure(lambda: list(Lesson.objects.filter(content__icontains=word)[:20]), repeat),
+            }
+            for key, timings in row.items():
+                totals[key].extend(timings)
+            self.stdout.write(
+                f'{text:<24}{statistics.median(row["index"]):>12.1f}'
+                f'{statistics.median(row["search"]):>14.1f}{statistics.median(row["ilike"]):>12.1f}'
+            )
+
+        for key, label in (('index', 'Поиск по индексу'), ('search', 'search() целиком'), ('ilike', 'ILIKE')):
+            timings = totals[key]
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: медиана {statistics.median(timings):.1f} мс, p95 {percentile(timings, 0.95):.1f} мс'
+            ))
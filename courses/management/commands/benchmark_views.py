@@ -0,0 +1,71 @@
+"""
+Замер представлений courses на синтетических данных разного объёма.
+
+Данные каждого масштаба создаются внутри транзакции и откатываются, так
+что базу можно использовать рабочую (на копии данных). Команда
+завершается с ошибкой, если представление превысило бюджет из
+courses/benchmark_budgets.json или число его запросов растёт с объёмом.
+
+Использование:
+python manage.py benchmark_views
+python manage.py benchmark_views --sizes 1,10,50 --repeat 5
+python manage.py benchmark_views --update-budgets
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from courses import benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Выполняет сценарии для всех маршрутов courses и сравнивает с бюджетами.
+    """
+
+    help = 'Замеряет запросы и время ответа представлений на данных разного объёма'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,4,16', help='Масштабы данных через запятую')
+        parser.add_argument('--repeat', type=int, default=3, help='Повторов каждого сценария')
+        parser.add_argument('--no-time', action='store_true', help='Не проверять бюджеты времени')
+        parser.add_argument('--update-budgets', action='store_true', help='Записать бюджеты по результатам')
+        parser.add_argument('--headroom', type=float, default=2.0, help='Запас бюджета времени при --update-budgets')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes: ожидаются целые числа через запятую')
+        if len(sizes) < 2 or sizes[0] < 1:
+            raise CommandError('--sizes: нужно не меньше двух положительных масштабов')
+
+        # Тестовый клиент требует тестового окружения (testserver, почта в памяти)
+        setup_test_environment()
+        try:
+            results = benchmarks.run(sizes, options['repeat'], progress=self.stdout.write)
+        except ValueError as error:
+            raise CommandError(error)
+        finally:
+            teardown_test_environment()
+
+        self.report(results)
+        if options['update_budgets']:
+            benchmarks.save_budgets(results, headroom=options['headroom'])
+            self.stdout.write(self.style.SUCCESS(f'Бюджеты записаны в {benchmarks.BUDGETS_PATH}'))
+            return
+
+        problems = benchmarks.check(results, benchmarks.load_budgets(), check_time=not options['no_time'])
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'Нарушений бюджета: {len(problems)}')
+        self.stdout.write(self.style.SUCCESS('Все представления в пределах бюджета'))
+
+    def report(self, results):
+        self.stdout.write(f"{'сценарий':<18} {'масштаб':>7} {'код':>4} {'запросов':>8} {'БД, мс':>8} {'шаблоны, мс':>11} {'всего, мс':>9}")
+        for item in sorted(results, key=lambda item: (item.scenario, item.size)):
+            self.stdout.write(
+                f'{item.scenario:<18} {item.size:>7} {item.status:>4} {item.queries:>8} '
+                f'{item.db_ms:>8.1f} {item.template_ms:>11.1f} {item.wall_ms:>9.1f}'
+            )
@@ -0,0 +1,460 @@
+"""
+Кастомная команда Django для создания тестовых данных.
+
+Без параметров создаёт демонстрационного студента и вводный курс. С
+параметрами масштаба дополнительно генерирует синтетическую базу:
+пользователей, курсы с уроками, тестами и экзаменами, просмотры уроков и
+попытки. Записи вставляются пакетами через bulk_create без сигналов, а
+денормализованные итоги, прогресс по курсам и поисковые векторы потом
+пересчитываются одним проходом. При одном и том же --seed данные
+совпадают (даты отсчитываются от начала текущих суток).
+
+Использование:
+python manage.py create_test_data
+python manage.py create_test_data --users 50000 --courses 200 --lessons-per-course 40 --attempts 1000000
+python manage.py create_test_data --users 1000 --courses 20 --attempts 20000 --with-answers --seed 7
+"""
+
+import math
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from courses.answer_keys import normalize_answer
+from courses.models import (
+    Course, Lesson, StudentProfile, LessonProgress, RegistrationRequest,
+    Test, TestQuestion, TestChoiceOption, TestAttempt, TestAnswer,
+    Exam, ExamQuestion, ExamChoiceOption, ExamTextAnswer, ExamAttempt, ExamAnswer,
+)
+from courses.page_cache import bump_content_version
+from courses.roles import ADMIN_GROUP, STUDENT_GROUP
+from courses.search import is_supported
+from courses.synthetic import FIRST_NAMES, LAST_NAMES, POSITIONS, TextGenerator, batched, explicit_timestamps
+
+
+DEMO_LESSONS = (
+    {
+        'title': 'Что такое геология?',
+        'content': 'Геология - это наука о Земле, её составе, строении и истории развития. В этом уроке мы рассмотрим основные направления геологии и её значение для человечества.',
+        'order_num': 1
+    },
+    {
+        'title': 'Минералы и их свойства',
+        'content': 'Минералы - это природные тела с определённым химическим составом и кристаллической структурой. Изучим основные свойства минералов: твёрдость, спайность, блеск, цвет.',
+        'order_num': 2
+    },
+    {
+        'title': 'Горные породы',
+        'content': 'Горные породы состоят из минералов. Различают магматические, осадочные и метаморфические породы. Рассмотрим их происхождение и примеры.',
+        'order_num': 3
+    },
+)
+
+# Доля попыток, приходящихся на экзамены, и вариантов ответа в вопросе
+EXAM_SHARE = 0.2
+OPTIONS_PER_QUESTION = 4
+
+# Столько выборов подряд без новой попытки означает, что экзамены без
+# пересдачи уже сданы всеми, кому доступны
+MAX_SKIPPED_DRAWS = 10000
+
+
+class Command(BaseCommand):
+    """
+    Команда для заполнения базы тестовыми данными.
+    """
+
+    help = 'Создает тестовые данные для курсов геологии (демонстрационные или заданного объёма)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0, help='Сколько синтетических студентов создать')
+        parser.add_argument('--courses', type=int, default=0, help='Сколько синтетических курсов создать')
+        parser.add_argument('--lessons-per-course', type=int, default=20)
+        parser.add_argument('--tests-per-course', type=int, default=2)
+        parser.add_argument('--exams-per-course', type=int, default=1)
+        parser.add_argument('--questions', type=int, default=10, help='Вопросов в тесте и экзамене')
+        parser.add_argument('--attempts', type=int, default=0, help='Всего попыток тестов и экзаменов')
+        parser.add_argument('--with-answers', action='store_true', help='Создать ответы на каждый вопрос попытки')
+        parser.add_argument('--pending', type=float, default=0.02, help='Доля неодобренных заявок на регистрацию')
+        parser.add_argument('--days', type=int, default=365, help='За сколько последних дней распределить события')
+        parser.add_argument('--prefix', default='gen', help='Префикс имён синтетических пользователей')
+        parser.add_argument('--password', default='student123', help='Общий пароль синтетических пользователей')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пакета для bulk_create')
+
+    def handle(self, *args, **options):
+        """
+        Основной метод команды.
+        """
+        self.stdout.write(self.style.SUCCESS('Начинаем создание тестовых данных...'))
+        self.create_demo_data()
+
+        if options['users'] or options['courses'] or options['attempts']:
+            self.check_options(options)
+            self.generate(options)
+
+        self.stdout.write(self.style.SUCCESS('Тестовые данные успешно созданы!'))
+
+    def create_demo_data(self):
+        # Создаем группы
+        Group.objects.get_or_create(name=ADMIN_GROUP)
+        student_group, _ = Group.objects.get_or_create(name=STUDENT_GROUP)
+
+        # Создаем тестового студента
+        if not User.objects.filter(username='student').exists():
+            user = User.objects.create_user(
+                username='student',
+                password='student123',
+                email='student@example.com'
+            )
+            user.groups.add(student_group)
+
+            StudentProfile.objects.create(
+                user=user,
+                first_name='Иван',
+                last_name='Петров',
+                position='Геолог-практикант'
+            )
+            self.stdout.write(self.style.SUCCESS('Создан тестовый студент'))
+
+        # Создаем тестовый курс
+        if not Course.objects.filter(title='Введение в геологию').exists():
+            course = Course.objects.create(
+                title='Введение в геологию',
+                description='Базовый курс для начинающих геологов. Вы узнаете о составе Земли, минералах, горных породах и основных геологических процессах.'
+            )
+            for lesson_data in DEMO_LESSONS:
+                Lesson.objects.create(course=course, **lesson_data)
+
+            self.stdout.write(self.style.SUCCESS('Создан тестовый курс с уроками'))
+
+    def check_options(self, options):
+        if options['attempts'] and not (options['users'] and options['courses']):
+            raise CommandError('Для попыток нужны --users и --courses')
+        if options['courses'] and options['lessons_per_course'] < 1:
+            raise CommandError('--lessons-per-course должен быть не меньше 1')
+        if options['attempts'] and not (options['tests_per_course'] or options['exams_per_course']):
+            raise CommandError('Для попыток нужны тесты или экзамены (--tests-per-course, --exams-per-course)')
+        if options['users'] and User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f'Пользователи с префиксом «{options["prefix"]}» уже есть, укажите другой --prefix')
+
+    # ----- Синтетическая база -----
+
+    def generate(self, options):
+        self.rng = random.Random(options['seed'])
+        self.texts = TextGenerator(self.rng)
+        self.batch_size = options['batch_size']
+        self.counts = Counter()
+        self.now = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.since = self.now - timedelta(days=options['days'])
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            courses = self.stage('Курсы', self.create_courses, options) if options['courses'] else []
+            users = self.stage('Пользователи', self.create_users, options) if options['users'] else []
+            enrollments = self.stage('Просмотры уроков', self.create_views, users, courses) if courses else []
+            if options['attempts']:
+                self.stage('Попытки', self.create_attempts, enrollments, courses, options)
+        for label, count in self.counts.items():
+            self.stdout.write(f'  {label}: {count}')
+
+        # bulk_create не вызывает сигналов: пересчитываем то, что они поддерживают
+        call_command('rebuild_course_progress', stdout=self.stdout)
+        if is_supported(Lesson):
+            call_command('rebuild_search_index', stdout=self.stdout)
+        bump_content_version()
+        if connection.vendor == 'postgresql':
+            # Свежая статистика, чтобы планы запросов соответствовали объёму
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        self.stdout.write(f'Всего: {time.perf_counter() - started:.1f} с')
+
+    def stage(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f'{label}: {time.perf_counter() - started:.1f} с')
+        return result
+
+    def insert(self, model, objects, keep=False):
+        """Вставляет объекты пакетами; при keep возвращает их с заполненными pk."""
+        created = []
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch)
+            self.counts[model._meta.verbose_name_plural] += len(batch)
+            if keep:
+                created.extend(batch)
+        return created
+
+    def random_time(self, since=None):
+        since = since or self.since
+        return since + (self.now - since) * self.rng.random()
+
+    def create_courses(self, options):
+        rng, texts = self.rng, self.texts
+
+        def course():
+            created_at = self.random_time()
+            return Course(
+                title=texts.title(4), description=texts.text(60), created_at=created_at, updated_at=created_at,
+            )
+
+        with explicit_timestamps(Course, Lesson, Test, Exam):
+            courses = self.insert(Course, (course() for _ in range(options['courses'])), keep=True)
+            lessons = self.insert(Lesson, (
+                Lesson(
+                    course=course, title=texts.title(), content=texts.text(150), order_num=number + 1,
+                    created_at=course.created_at + timedelta(hours=number),
+                )
+                for course in courses for number in range(options['lessons_per_course'])
+            ), keep=True)
+            tests = self.insert(Test, (
+                Test(
+                    course=course, title=f'Тест: {texts.title(2)}', description=texts.text(20),
+                    passing_score=rng.choice((60, 70, 80)), time_limit=rng.choice((0, 15, 30)),
+                    created_at=course.created_at,
+                )
+                for course in courses for _ in range(options['tests_per_course'])
+            ), keep=True)
+            exams = self.insert(Exam, (
+                Exam(
+                    course=course, title=f'Экзамен: {texts.title(2)}', description=texts.text(20),
+                    passing_score=rng.choice((60, 70, 80)), allow_retake=rng.random() < 0.3,
+                    created_at=course.created_at,
+                )
+                for course in courses for _ in range(options['exams_per_course'])
+            ), keep=True)
+
+        structure = {
+            course.pk: {'popularity': 0, 'lessons': [], 'tests': [], 'exams': []} for course in courses
+        }
+        for lesson in lessons:
+            structure[lesson.course_id]['lessons'].append(lesson.pk)
+        for test, questions in zip(tests, self.create_questions(tests, TestQuestion, TestChoiceOption, options)):
+            structure[test.course_id]['tests'].append(self.describe(test, questions))
+        for exam, questions in zip(exams, self.create_questions(exams, ExamQuestion, ExamChoiceOption, options)):
+            structure[exam.course_id]['exams'].append(self.describe(exam, questions))
+        Test.objects.filter(pk__in=[test.pk for test in tests]).refresh_totals()
+        Exam.objects.filter(pk__in=[exam.pk for exam in exams]).refresh_totals()
+
+        # Популярность курсов по закону Ципфа: немногие курсы собирают большую часть студентов
+        result = list(structure.values())
+        ranks = list(range(len(result)))
+        rng.shuffle(ranks)
+        for course, rank in zip(result, ranks):
+            course['popularity'] = 1 / (rank + 1) ** 0.8
+        return result
+
+    def create_questions(self, assessments, question_model, option_model, options):
+        """Вопросы с вариантами ответа; возвращает списки описаний вопросов по порядку assessments."""
+        rng, texts = self.rng, self.texts
+        is_exam = question_model is ExamQuestion
+        owner = 'exam' if is_exam else 'test'
+
+        questions = self.insert(question_model, (
+            question_model(**{
+                owner: assessment,
+                'text': texts.text(12) + '?',
+                'points': rng.choice((1, 1, 1, 2, 3)),
+                'order': number,
+                **({'type': 'text' if rng.random() < 0.2 else 'choice'} if is_exam else {}),
+            })
+            for assessment in assessments for number in range(options['questions'])
+        ), keep=True)
+
+        described = {question.pk: {
+            'pk': question.pk,
+            'points': question.points,
+            'type': getattr(question, 'type', 'choice'),
+            'correct': [],
+            'wrong': [],
+            'answer': '',
+        } for question in questions}
+
+        choice_questions = [question for question in questions if described[question.pk]['type'] == 'choice']
+        correct_index = {question.pk: rng.randrange(OPTIONS_PER_QUESTION) for question in choice_questions}
+        created = self.insert(option_model, (
+            option_model(question=question, text=texts.title(2), is_correct=index == correct_index[question.pk])
+            for question in choice_questions for index in range(OPTIONS_PER_QUESTION)
+        ), keep=True)
+        for option in created:
+            described[option.question_id]['correct' if option.is_correct else 'wrong'].append(option.pk)
+
+        if is_exam:
+            text_answers = self.insert(ExamTextAnswer, (
+                ExamTextAnswer(question=question, correct_answer=texts.title(1).lower())
+                for question in questions if described[question.pk]['type'] == 'text'
+            ), keep=True)
+            for answer in text_answers:
+                described[answer.question_id]['answer'] = answer.correct_answer
+
+        by_assessment = {assessment.pk: [] for assessment in assessments}
+        for question in questions:
+            by_assessment[getattr(question, f'{owner}_id')].append(described[question.pk])
+        return [by_assessment[assessment.pk] for assessment in assessments]
+
+    @staticmethod
+    def describe(assessment, questions):
+        return {
+            'pk': assessment.pk,
+            'passing_score': assessment.passing_score,
+            'allow_retake': getattr(assessment, 'allow_retake', True),
+            'max_score': sum(question['points'] for question in questions),
+            'questions': questions,
+        }
+
+    def create_users(self, options):
+        rng, prefix = self.rng, options['prefix']
+        # Хэш пароля считается один раз: PBKDF2 для каждого из десятков тысяч
+        # пользователей занял бы больше времени, чем вся остальная генерация
+        password = make_password(options['password'])
+
+        def user(number):
+            return User(
+                username=f'{prefix}{number:06d}', email=f'{prefix}{number:06d}@example.com', password=password,
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                is_active=rng.random() >= options['pending'], date_joined=self.random_time(),
+            )
+
+        users = self.insert(User, (user(number) for number in range(options['users'])), keep=True)
+        student_group = Group.objects.get(name=STUDENT_GROUP)
+        self.insert(User.groups.through, (
+            User.groups.through(user_id=user.pk, group_id=student_group.pk) for user in users
+        ))
+        self.insert(StudentProfile, (
+            StudentProfile(user=user, first_name=user.first_name, last_name=user.last_name, position=rng.choice(POSITIONS))
+            for user in users
+        ))
+        with explicit_timestamps(RegistrationRequest):
+            self.insert(RegistrationRequest, (
+                RegistrationRequest(
+                    user=user, created_at=user.date_joined,
+                    status='approved' if user.is_active else 'pending',
+                    reviewed_at=user.date_joined + timedelta(hours=rng.expovariate(1 / 24)) if user.is_active else None,
+                )
+                for user in users
+            ))
+        # Способность студента определяет долю верных ответов во всех его попытках
+        return [(user.pk, user.date_joined, rng.betavariate(5, 2.5)) for user in users if user.is_active]
+
+    def create_views(self, users, courses):
+        """
+        Просмотры уроков; возвращает записи на курсы (студент, курс, начало, способность).
+
+        Студент записывается в несколько курсов с учётом их популярности и
+        смотрит уроки по порядку; большинство бросает курс в начале.
+        """
+        rng = self.rng
+        weights = [course['popularity'] for course in courses]
+        enrollments = []
+
+        def views():
+            for user_pk, joined, skill in users:
+                count = min(len(courses), 1 + int(rng.expovariate(0.5)))
+                chosen = list(dict.fromkeys(rng.choices(range(len(courses)), weights, k=count * 2)))[:count]
+                for index in chosen:
+                    lessons = courses[index]['lessons']
+                    started = self.random_time(joined)
+                    enrollments.append((user_pk, index, started, skill))
+                    viewed = max(1, math.ceil(rng.betavariate(0.8, 1.4) * len(lessons)))
+                    moment = started
+                    for lesson_pk in lessons[:viewed]:
+                        yield LessonProgress(user_id=user_pk, lesson_id=lesson_pk, viewed_at=moment)
+                        moment = min(moment + timedelta(hours=rng.expovariate(1 / 30)), self.now)
+
+        with explicit_timestamps(LessonProgress):
+            self.insert(LessonProgress, views())
+        return enrollments
+
+    def create_attempts(self, enrollments, courses, options):
+        if not enrollments:
+            raise CommandError('Нет записей на курсы: все синтетические пользователи неактивны')
+        with explicit_timestamps(TestAttempt, ExamAttempt):
+            for batch in batched(self.attempts(enrollments, courses, options['attempts']), self.batch_size):
+                for model in (TestAttempt, ExamAttempt):
+                    rows = [(attempt, results) for attempt, results in batch if type(attempt) is model]
+                    if not rows:
+                        continue
+                    model.objects.bulk_create([attempt for attempt, _ in rows])
+                    self.counts[model._meta.verbose_name_plural] += len(rows)
+                    if options['with_answers']:
+                        self.create_answers(model, rows)
+
+    def attempts(self, enrollments, courses, total):
+        """Поток пар (попытка, [(вопрос, ответ верный)]) со связными баллами и датами."""
+        rng = self.rng
+        taken_exams = set()
+        produced = skipped = 0
+        while produced < total:
+            user_pk, index, started, skill = rng.choice(enrollments)
+            course = courses[index]
+            if course['exams'] and (rng.random() < EXAM_SHARE or not course['tests']):
+                model, assessment = ExamAttempt, rng.choice(course['exams'])
+                # Без права пересдачи экзамен сдают один раз, вместо повтора - тест, если он есть
+                if not assessment['allow_retake'] and (user_pk, assessment['pk']) in taken_exams:
+                    if not course['tests']:
+                        skipped += 1
+                        if skipped >= MAX_SKIPPED_DRAWS:
+                            raise CommandError(
+                                f'Создано {produced} попыток из {total}: экзамены без пересдачи уже сданы, '
+                                f'а тестов в курсах нет (увеличьте --users или --tests-per-course)'
+                            )
+                        continue
+                    model, assessment = TestAttempt, rng.choice(course['tests'])
+                else:
+                    taken_exams.add((user_pk, assessment['pk']))
+            else:
+                model, assessment = TestAttempt, rng.choice(course['tests'])
+
+            ability = min(1.0, max(0.0, rng.gauss(skill, 0.15)))
+            results = [(question, rng.random() < ability) for question in assessment['questions']]
+            score = sum(question['points'] for question, correct in results if correct)
+            started_at = self.random_time(started)
+            attempt = model(
+                user_id=user_pk, started_at=started_at,
+                completed_at=started_at + timedelta(minutes=rng.uniform(3, 40)),
+                score=score,
+                passed=assessment['max_score'] > 0 and score * 100 >= assessment['passing_score'] * assessment['max_score'],
+                **{'exam_id' if model is ExamAttempt else 'test_id': assessment['pk']},
+            )
+            produced += 1
+            skipped = 0
+            yield attempt, results
+
+    def wrong_text_answer(self, correct_answer):
+        """Случайный ответ, который проверка не засчитает."""
+        accepted = {normalize_answer(variant) for variant in correct_answer.split('|')}
+        while True:
+            answer = self.texts.title(1).lower()
+            if normalize_answer(answer) not in accepted:
+                return answer
+
+    def create_answers(self, model, rows):
+        rng = self.rng
+        answer_model = TestAnswer if model is TestAttempt else ExamAnswer
+        field = answer_model._meta.get_field('selected_options')
+        through = field.remote_field.through
+        from_field, to_field = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+
+        answers = []
+        for attempt, results in rows:
+            for question, correct in results:
+                answer = answer_model(attempt=attempt, question_id=question['pk'])
+                if question['type'] == 'text':
+                    answer.text_answer = question['answer'] if correct else self.wrong_text_answer(question['answer'])
+                answers.append((answer, question, correct))
+        answer_model.objects.bulk_create([answer for answer, _, _ in answers], batch_size=self.batch_size)
+        self.counts[answer_model._meta.verbose_name_plural] += len(answers)
+
+        self.insert(through, (
+            through(**{from_field: answer.pk, to_field: option_pk})
+            for answer, question, correct in answers if question['type'] == 'choice'
+            for option_pk in (question['correct'] if correct else [rng.choice(question['wrong'])])
+        ))
@@ -0,0 +1,39 @@
+"""
+Счётчики пулов соединений с БД во всех воркерах.
+
+Воркеры публикуют счётчики в общий кэш раз в DB_POOL_STATS_INTERVAL
+секунд, поэтому данные могут отставать на это время.
+
+Использование:
+python manage.py db_pool_stats
+"""
+
+from django.core.management.base import BaseCommand
+
+from geology_education.db_pool.pool import published_stats
+
+
+COLUMNS = ('in_use', 'idle', 'max_size', 'checkouts', 'created', 'waits', 'timeouts', 'discarded')
+
+
+class Command(BaseCommand):
+    """
+    Выводит по каждому воркеру занятые и свободные соединения, число
+    ожиданий свободного соединения и отказов по таймауту.
+    """
+
+    help = 'Показывает состояние пулов соединений с БД в воркерах'
+
+    def handle(self, *args, **options):
+        stats = published_stats()
+        if not stats:
+            self.stdout.write('Нет данных: воркеры ещё не обработали ни одного запроса')
+            return
+        self.stdout.write(f"{'воркер':<30}" + ''.join(f'{name:>11}' for name in COLUMNS))
+        totals = dict.fromkeys(COLUMNS, 0)
+        for worker, counters in sorted(stats.items()):
+            self.stdout.write(f'{worker:<30}' + ''.join(f'{counters.get(name, 0):>11}' for name in COLUMNS))
+            for name in COLUMNS:
+                totals[name] += counters.get(name, 0)
+        line = f"{'всего':<30}" + ''.join(f'{totals[name]:>11}' for name in COLUMNS)
+        self.stdout.write(self.style.WARNING(line) if totals['timeouts'] else self.style.SUCCESS(line))
@@ -0,0 +1,53 @@
+"""
+Создание копий изображений для уже загруженных курсов и уроков.
+
+Использование:
+python manage.py generate_image_variants
+python manage.py generate_image_variants --workers 8 --force
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from courses.images import current_variants, generate_variants
+from courses.models import Course, Lesson
+
+
+class Command(BaseCommand):
+    """
+    Создаёт JPEG и WebP копии изображений, у которых их ещё нет.
+
+    Изображения обрабатываются в пуле процессов (Pillow занимает ядро
+    целиком), результат записывается в БД основным процессом.
+    """
+
+    help = 'Создаёт уменьшенные копии изображений курсов и уроков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Число процессов')
+        parser.add_argument('--force', action='store_true', help='Пересоздать и уже существующие копии')
+
+    def handle(self, *args, **options):
+        for model in (Course, Lesson):
+            rows = model.objects.exclude(image='').exclude(image__isnull=True).values_list('pk', 'image', 'image_variants')
+            pending = [
+                (pk, name) for pk, name, variants in rows.iterator()
+                if options['force'] or not current_variants(name, variants)
+            ]
+            if not pending:
+                continue
+            done = failed = 0
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                names = [name for _, name in pending]
+                for (pk, name), variants in zip(pending, pool.map(generate_variants, names, chunksize=4)):
+                    if variants is None:
+                        failed += 1
+                        self.stderr.write(f'{model._meta.verbose_name} #{pk}: не удалось прочитать {name}')
+                        continue
+                    model.objects.filter(pk=pk).update(image_variants=variants)
+                    done += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: обработано {done}, ошибок {failed}'
+            ))
@@ -0,0 +1,40 @@
+"""
+Массовый импорт студентов из CSV или XLSX.
+
+Формат файла и что создаётся - см. courses.student_import. Строки с
+ошибками выводятся и пропускаются, остальные импортируются.
+
+Использование:
+python manage.py import_students team.csv
+python manage.py import_students team.xlsx --dry-run
+"""
+
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.student_import import ImportFileError, import_students
+
+
+class Command(BaseCommand):
+    """
+    Импортирует студентов с заявками на регистрацию из файла.
+    """
+
+    help = 'Импортирует студентов из CSV или XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV или XLSX с заголовками в первой строке')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить строки, ничего не создавая')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        try:
+            result = import_students(path.read_bytes(), path.name, dry_run=options['dry_run'])
+        except (OSError, ImportFileError) as error:
+            raise CommandError(error)
+
+        for number, message in result.errors:
+            self.stderr.write(f'Строка {number}: {message}')
+        verb = 'Готово к импорту' if options['dry_run'] else 'Импортировано'
+        self.stdout.write(self.style.SUCCESS(f'{verb} студентов: {result.created}, строк с ошибками: {len(result.errors)}'))
@@ -0,0 +1,131 @@
+"""
+Нагрузочный тест: N одновременных клиентов с постоянными соединениями.
+
+Позволяет сравнить пропускную способность профилей gunicorn (WSGI и ASGI,
+см. gunicorn.conf.py) на одних и тех же страницах.
+
+Использование:
+python manage.py loadtest http://127.0.0.1:8000 --path /courses/ --path /course/1/
+python manage.py loadtest http://127.0.0.1:8000 --concurrency 200 --duration 30 --cookie sessionid=...
+"""
+
+import asyncio
+import itertools
+from collections import Counter
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class HTTPError(Exception):
+    def __str__(self):
+        return f'HTTP {self.args[0]}'
+
+
+async def read_response(reader):
+    """Читает ответ HTTP/1.1, возвращает (статус, признак закрытия соединения)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, True
+    return status, headers.get('connection') == 'close'
+
+
+class Command(BaseCommand):
+    """
+    Держит --concurrency соединений и в каждом последовательно запрашивает
+    страницы из --path по кругу в течение --duration секунд.
+    """
+
+    help = 'Замеряет пропускную способность сервера при N одновременных клиентах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='Адрес сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths', help='Путь страницы (можно несколько)')
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument('--cookie', default='', help='Значение заголовка Cookie (например, sessionid=...)')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['base_url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Поддерживаются только адреса http://хост[:порт]')
+        paths = options['paths'] or ['/', '/courses/']
+        stats = asyncio.run(self.run(url.hostname, url.port or 80, paths, options))
+
+        latencies, elapsed = stats['latencies'], stats['elapsed']
+        errors = ', '.join(f'{kind}: {count}' for kind, count in stats['errors'].most_common()) or '0'
+        if not latencies:
+            raise CommandError(f'Ни одного успешного ответа, ошибок: {errors}')
+        latencies.sort()
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+        self.stdout.write(
+            f'Клиентов: {options["concurrency"]}, длительность: {elapsed:.1f} с, страницы: {", ".join(paths)}'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Запросов: {len(latencies)} ({len(latencies) / elapsed:.1f} в секунду), ошибок: {errors}'
+        ))
+        self.stdout.write(
+            f'Задержка, мс: медиана {statistics.median(latencies) * 1000:.1f}, '
+            f'p95 {percentile(0.95):.1f}, p99 {percentile(0.99):.1f}, максимум {latencies[-1] * 1000:.1f}'
+        )
+
+    async def run(self, host, port, paths, options):
+        stats = {'latencies': [], 'errors': Counter()}
+        deadline = time.monotonic() + options['duration']
+        cookie = f'Cookie: {options["cookie"]}\r\n' if options['cookie'] else ''
+        requests = [
+            f'GET {path} HTTP/1.1\r\nHost: {host}\r\n{cookie}Accept-Encoding: identity\r\n\r\n'.encode()
+            for path in paths
+        ]
+
+        async def client(offset):
+            reader = writer = None
+            for request in itertools.islice(itertools.cycle(requests), offset, None):
+                if time.monotonic() >= deadline:
+                    break
+                started = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(host, port)
+                    writer.write(request)
+                    await writer.drain()
+                    status, closed = await read_response(reader)
+                    if status >= 400:
+                        raise HTTPError(status)
+                    stats['latencies'].append(time.perf_counter() - started)
+                except (OSError, asyncio.IncompleteReadError, HTTPError, ValueError, IndexError) as exc:
+                    stats['errors'][str(exc) if isinstance(exc, HTTPError) else type(exc).__name__] += 1
+                    closed = True
+                    # Не забиваем недоступный сервер повторными подключениями
+                    await asyncio.sleep(0.05)
+                if closed and writer is not None:
+                    writer.close()
+                    reader = writer = None
+            if writer is not None:
+                writer.close()
+
+        started = time.monotonic()
+        await asyncio.gather(*(client(i % len(requests)) for i in range(options['concurrency'])))
+        stats['elapsed'] = time.monotonic() - started
+        return stats
@@ -0,0 +1,33 @@
+"""
+Статистика кэша страниц каталога.
+
+Использование:
+python manage.py page_cache_stats
+python manage.py page_cache_stats --reset
+"""
+
+from django.core.management.base import BaseCommand
+
+from courses.page_cache import page_cache_stats, reset_page_cache_stats, get_content_version
+
+
+class Command(BaseCommand):
+    """
+    Выводит счётчики попаданий и промахов кэша страниц для анонимных пользователей.
+    """
+
+    help = 'Показывает попадания и промахи кэша страниц каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = page_cache_stats()
+        self.stdout.write(f"Версия контента: {get_content_version()}")
+        self.stdout.write(f"Попадания: {stats['hits']}")
+        self.stdout.write(f"Устаревшие копии: {stats['stale']}")
+        self.stdout.write(f"Промахи: {stats['misses']}")
+        self.stdout.write(self.style.SUCCESS(f"Доля попаданий: {stats['hit_rate']:.1%}"))
+        if options['reset']:
+            reset_page_cache_stats()
+            self.stdout.write('Счётчики обнулены')
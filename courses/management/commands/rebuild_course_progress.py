@@ -0,0 +1,25 @@
+"""
+Перестроение сводного прогресса по курсам.
+
+Использование:
+python manage.py rebuild_course_progress
+"""
+
+from django.core.management.base import BaseCommand
+
+from courses.progress import rebuild_course_progress
+
+
+class Command(BaseCommand):
+    """
+    Заново заполняет CourseProgress по существующим просмотрам уроков.
+    """
+
+    help = 'Перестраивает таблицу прогресса по курсам из LessonProgress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пакета для bulk_create')
+
+    def handle(self, *args, **options):
+        created = rebuild_course_progress(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Создано строк прогресса: {created}'))
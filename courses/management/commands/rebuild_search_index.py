@@ -0,0 +1,37 @@
+"""
+Перестроение поисковых векторов.
+
+Нужно после загрузок в обход сигналов (bulk_create, queryset.update, SQL).
+
+Использование:
+python manage.py rebuild_search_index
+python manage.py rebuild_search_index --batch-size 2000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from courses.search import SEARCH_FIELDS, is_supported, update_search_vectors
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает search_vector курсов, уроков и вопросов диапазонами id.
+    """
+
+    help = 'Пересчитывает поисковые векторы курсов, уроков и вопросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Сколько id обновлять одним UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in SEARCH_FIELDS:
+            if not is_supported(model):
+                raise CommandError('Полнотекстовый поиск доступен только на PostgreSQL')
+            last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+            updated = 0
+            # Короткие транзакции по диапазонам id не держат блокировки всей таблицы
+            for start in range(0, last_pk, batch_size):
+                updated += update_search_vectors(model, pk__gt=start, pk__lte=start + batch_size)
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.verbose_name_plural}: обновлено {updated}'))
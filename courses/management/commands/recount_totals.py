@@ -0,0 +1,53 @@
+"""
+Пересчёт и проверка денормализованных итогов тестов и экзаменов.
+
+Использование:
+python manage.py recount_totals          # исправить расхождения
+python manage.py recount_totals --check  # только проверить расхождения
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from courses.models import Test, Exam
+
+
+class Command(BaseCommand):
+    """
+    Сверяет max_score и question_count с вопросами и исправляет расхождения.
+    """
+
+    help = 'Пересчитывает максимальный балл и количество вопросов тестов и экзаменов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только вывести расхождения, ничего не меняя (код возврата 1 при ошибках)',
+        )
+
+    def handle(self, *args, **options):
+        mismatched = 0
+        for model in (Test, Exam):
+            stale = list(
+                model.objects.with_actual_totals()
+                .exclude(max_score=F('actual_max_score'), question_count=F('actual_question_count'))
+                .values_list('pk', 'max_score', 'actual_max_score', 'question_count', 'actual_question_count')
+            )
+            for pk, max_score, actual_score, count, actual_count in stale:
+                self.stdout.write(
+                    f'{model._meta.verbose_name} #{pk}: баллы {max_score} -> {actual_score}, '
+                    f'вопросов {count} -> {actual_count}'
+                )
+            mismatched += len(stale)
+
+            if not options['check'] and stale:
+                updated = model.objects.filter(pk__in=[row[0] for row in stale]).refresh_totals()
+                self.stdout.write(self.style.SUCCESS(
+                    f'{model._meta.verbose_name_plural}: исправлено {updated}'
+                ))
+
+        if options['check'] and mismatched:
+            raise CommandError(f'Найдено расхождений: {mismatched}')
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
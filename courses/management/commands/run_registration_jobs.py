@@ -0,0 +1,32 @@
+"""
+Продолжение фоновых заданий по заявкам на регистрацию.
+
+Задание выполняется в потоке воркера; если воркер перезапустили, оно
+остаётся в статусе «Выполняется» без прогресса. Команда продолжает такие
+задания (и задания из очереди) с места остановки. Удобно запускать после
+деплоя или по cron.
+
+Использование:
+python manage.py run_registration_jobs
+"""
+
+from django.core.management.base import BaseCommand
+
+from courses.registrations import claimable_jobs, run_job
+
+
+class Command(BaseCommand):
+    """
+    Выполняет задания в очереди и прерванные задания пакетного рассмотрения заявок.
+    """
+
+    help = 'Продолжает прерванные задания по заявкам на регистрацию'
+
+    def handle(self, *args, **options):
+        job_ids = list(claimable_jobs().order_by('created_at').values_list('pk', flat=True))
+        if not job_ids:
+            self.stdout.write('Незавершённых заданий нет')
+            return
+        for job_id in job_ids:
+            if run_job(job_id):
+                self.stdout.write(f'Задание №{job_id} выполнено')
@@ -0,0 +1,227 @@
+"""
+Промежуточные слои приложения courses.
+"""
+
+import asyncio
+import cProfile
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from geology_education import db_router, metrics, profiling
+
+
+REPLICA_PIN_COOKIE = 'db_primary'
+
+
+def _view_label(request):
+    match = request.resolver_match
+    if match is not None:
+        return match.view_name
+    # Метка без пути, чтобы число рядов метрик не росло от случайных URL
+    return 'static' if request.path_info.startswith(settings.STATIC_URL) else 'unresolved'
+
+
+def _record_request(request, response, started, request_metrics):
+    total = time.perf_counter() - started
+    view = _view_label(request)
+    metrics.registry.observe(view, request.method, response.status_code, total, request_metrics)
+    response['Server-Timing'] = request_metrics.server_timing(total)
+    if total >= settings.SLOW_REQUEST_THRESHOLD:
+        metrics.log_slow_request(request, view, total, request_metrics)
+    metrics.publish(settings.METRICS_PUBLISH_INTERVAL)
+    return response
+
+
+@sync_and_async_middleware
+def performance_middleware(get_response):
+    """
+    Замеряет запрос: число SQL-запросов и время в БД, рендеринг шаблонов и
+    общее время (см. geology_education.metrics). Замеры отдаются в
+    заголовке Server-Timing, копятся в гистограммах по маршрутам, а запросы
+    дольше SLOW_REQUEST_THRESHOLD секунд пишутся в журнал вместе с SQL.
+    Стоит первым, чтобы учитывать время всей цепочки.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            token = metrics.begin_request()
+            try:
+                response = await get_response(request)
+            finally:
+                request_metrics = metrics.end_request(token)
+            return await sync_to_async(_record_request, thread_sensitive=False)(
+                request, response, started, request_metrics,
+            )
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            token = metrics.begin_request()
+            try:
+                response = get_response(request)
+            finally:
+                request_metrics = metrics.end_request(token)
+            return _record_request(request, response, started, request_metrics)
+
+    return middleware
+
+
+def _profiling_allowed(token):
+    user_id = profiling.token_user_id(token)
+    # Токен перестаёт действовать, если у пользователя отобрали права сотрудника
+    return user_id is not None and User.objects.filter(pk=user_id, is_staff=True, is_active=True).exists()
+
+
+def _save_profile(request, response, profiler, duration):
+    profile = profiling.describe(request, response, profiler, duration, metrics.current_request())
+    response['X-Profile-Id'] = profiling.ProfileStore().save(profile, profiler)
+    return response
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """
+    Выполняет под cProfile запросы с токеном профилирования сотрудника
+    (см. geology_education.profiling) и сохраняет профиль; его номер
+    возвращается в заголовке X-Profile-Id. Остальные запросы проходят
+    без изменений.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = profiling.requested_token(request)
+            if token is None or not await sync_to_async(_profiling_allowed)(token):
+                return await get_response(request)
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = await get_response(request)
+            finally:
+                profiler.disable()
+            return await sync_to_async(_save_profile)(request, response, profiler, time.perf_counter() - started)
+    else:
+        def middleware(request):
+            token = profiling.requested_token(request)
+            if token is None or not _profiling_allowed(token):
+                return get_response(request)
+            response, profiler, duration = profiling.profile_call(get_response, request)
+            return _save_profile(request, response, profiler, duration)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def concurrency_limit_middleware(get_response):
+    """
+    Ограничивает число одновременно обрабатываемых запросов воркера ASGI.
+
+    Каждый запрос под ASGI работает с БД в собственном потоке и держит
+    собственное соединение, поэтому без ограничения 200 клиентов открывают
+    200 соединений и упираются в max_connections PostgreSQL. Лишние запросы
+    ждут в очереди внутри воркера.
+    Синхронный воркер обрабатывает один запрос, для него слой пропускается.
+    """
+    if not iscoroutinefunction(get_response):
+        return get_response
+
+    semaphore = asyncio.Semaphore(settings.ASGI_MAX_CONCURRENT_REQUESTS)
+
+    async def middleware(request):
+        async with semaphore:
+            return await get_response(request)
+
+    return middleware
+
+
+def _is_replica_view(match):
+    if getattr(match.func, 'replica_reads', False):
+        return True
+    # Списки объектов в админке только читают (действия отправляются POST)
+    return match.app_name == 'admin' and (match.url_name or '').endswith('_changelist')
+
+
+def _reads_from_replica(request):
+    if not settings.DATABASE_REPLICAS or request.method not in ('GET', 'HEAD'):
+        return False
+    if REPLICA_PIN_COOKIE in request.COOKIES:
+        return False
+    try:
+        return _is_replica_view(resolve(request.path_info))
+    except Resolver404:
+        return False
+
+
+def _pin_to_primary(request, response, wrote):
+    # После записи пользователь REPLICA_STICKY_SECONDS секунд читает из основной БД
+    if wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        response.set_cookie(
+            REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """
+    Направляет чтение страниц с пометкой replica_reads на реплику
+    (см. geology_education.db_router) и закрепляет пользователя за
+    основной БД после записи. Должен стоять до SessionMiddleware, чтобы
+    сохранение сессии тоже считалось записью.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = db_router.begin_request(_reads_from_replica(request))
+            try:
+                response = await get_response(request)
+            finally:
+                wrote = db_router.end_request(token)
+            return _pin_to_primary(request, response, wrote)
+    else:
+        def middleware(request):
+            token = db_router.begin_request(_reads_from_replica(request))
+            try:
+                response = get_response(request)
+            finally:
+                wrote = db_router.end_request(token)
+            return _pin_to_primary(request, response, wrote)
+
+    return middleware
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, поддерживающий асинхронную цепочку middleware.
+
+    Исходный WhiteNoiseMiddleware только синхронный, и под ASGI Django
+    из-за него выполняет всю цепочку и асинхронные представления в
+    отдельном потоке через async_to_sync.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Открытие файла и проверка заголовков - синхронный ввод-вывод
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
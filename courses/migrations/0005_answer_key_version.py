@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_registrationrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='answer_key_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия ключа ответов'),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='answer_key_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия ключа ответов'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    for owner_name, question_name, field_name in (
+        ('Test', 'TestQuestion', 'test'),
+        ('Exam', 'ExamQuestion', 'exam'),
+    ):
+        owner = apps.get_model('courses', owner_name)
+        question = apps.get_model('courses', question_name)
+        questions = question.objects.filter(**{field_name: OuterRef('pk')}).order_by().values(field_name)
+        owner.objects.update(
+            max_score=Coalesce(Subquery(questions.annotate(total=Sum('points')).values('total')), 0),
+            question_count=Coalesce(Subquery(questions.annotate(total=Count('pk')).values('total')), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_answer_key_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='max_score',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Максимальный балл'),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество вопросов'),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='max_score',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Максимальный балл'),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество вопросов'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+def fill_course_progress(apps, schema_editor):
+    Lesson = apps.get_model('courses', 'Lesson')
+    LessonProgress = apps.get_model('courses', 'LessonProgress')
+    CourseProgress = apps.get_model('courses', 'CourseProgress')
+    totals = dict(
+        Lesson.objects.order_by().values('course_id').annotate(total=Count('pk')).values_list('course_id', 'total')
+    )
+    rows = (
+        LessonProgress.objects.order_by()
+        .values('user_id', 'lesson__course_id')
+        .annotate(viewed=Count('pk'), last_viewed=Max('viewed_at'))
+    )
+    CourseProgress.objects.bulk_create([
+        CourseProgress(
+            user_id=row['user_id'],
+            course_id=row['lesson__course_id'],
+            viewed_count=row['viewed'],
+            total_lessons=totals.get(row['lesson__course_id'], 0),
+            last_viewed_at=row['last_viewed'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0006_question_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('viewed_count', models.PositiveIntegerField(default=0, verbose_name='Просмотрено уроков')),
+                ('total_lessons', models.PositiveIntegerField(default=0, verbose_name='Всего уроков')),
+                ('last_viewed_at', models.DateTimeField(verbose_name='Последний просмотр')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='courses.course', verbose_name='Курс')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_progress', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Прогресс по курсу',
+                'verbose_name_plural': 'Прогресс по курсам',
+                'indexes': [models.Index(fields=['user', '-last_viewed_at'], name='courseprogress_user_recent')],
+                'unique_together': {('user', 'course')},
+            },
+        ),
+        migrations.RunPython(fill_course_progress, migrations.RunPython.noop),
+    ]
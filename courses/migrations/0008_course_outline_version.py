@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_courseprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='outline_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия оглавления'),
+        ),
+    ]
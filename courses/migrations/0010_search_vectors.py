@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+SEARCH_FIELDS = (
+    ('Course', (('title', 'A'), ('description', 'B'))),
+    ('Lesson', (('title', 'A'), ('content', 'B'))),
+    ('TestQuestion', (('text', 'A'),)),
+    ('ExamQuestion', (('text', 'A'),)),
+)
+
+
+def fill_search_vectors(apps, schema_editor):
+    # Индексы создаются после заполнения, чтобы не перестраивать их построчно
+    for model_name, fields in SEARCH_FIELDS:
+        vector = None
+        for name, weight in fields:
+            part = SearchVector(name, weight=weight, config='russian')
+            vector = part if vector is None else vector + part
+        apps.get_model('courses', model_name).objects.update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_course_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='examquestion',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='testquestion',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='course_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examquestion',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='examquestion_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='lesson_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testquestion',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='testquestion_search_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0011_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationBatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('approve', 'Одобрение'), ('reject', 'Отклонение')], max_length=10, verbose_name='Действие')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершено'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Статус')),
+                ('request_ids', models.JSONField(default=list, editable=False, verbose_name='Заявки')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Выбрано заявок')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано')),
+                ('changed', models.PositiveIntegerField(default=0, verbose_name='Одобрено или отклонено')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Обновлено')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Запустил')),
+            ],
+            options={
+                'verbose_name': 'Пакетное рассмотрение заявок',
+                'verbose_name_plural': 'Пакетные рассмотрения заявок',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
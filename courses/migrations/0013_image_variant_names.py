@@ -0,0 +1,37 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+
+def drop_legacy_variants(apps, schema_editor):
+    """
+    Копии назывались без расширения оригинала (rocks_320w.jpg) и у
+    rocks.png и rocks.jpg совпадали. Старые файлы удаляются, список копий
+    сбрасывается: до запуска generate_image_variants страницы показывают
+    оригиналы.
+    """
+    models = [apps.get_model('courses', name) for name in ('Course', 'Lesson')]
+    originals = set()
+    for model in models:
+        originals.update(model.objects.exclude(image='').values_list('image', flat=True))
+    for model in models:
+        for variants in model.objects.exclude(image_variants={}).values_list('image_variants', flat=True).iterator():
+            root, _ = os.path.splitext(variants['source'])
+            for width in variants['widths']:
+                for ext in ('jpg', 'webp'):
+                    name = f'{root}_{width}w.{ext}'
+                    if name not in originals:
+                        default_storage.delete(name)
+        model.objects.exclude(image_variants={}).update(image_variants={})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_registration_batch_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_legacy_variants, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Count, Exists, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 
 class StudentProfile(models.Model):
     """
@@ -36,13 +41,24 @@ class Course(models.Model):
         null=True,
         help_text='Загрузите обложку курса (рекомендуемый размер 800x600)'
     )
+    # Ширины созданных копий изображения (см. images)
+    image_variants = models.JSONField('Копии изображения', default=dict, blank=True, editable=False)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
     updated_at = models.DateTimeField('Дата обновления', auto_now=True)
+    # Увеличивается при изменении состава и порядка уроков (см. outline)
+    outline_version = models.PositiveIntegerField('Версия оглавления', default=0, editable=False)
+    # Заполняется сигналом при сохранении (см. search)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Курс'
         verbose_name_plural = 'Курсы'
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Сортировка каталога и постраничный вывод по ключу (см. pagination)
+            models.Index(fields=['-created_at', '-id'], name='course_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='course_search_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -66,6 +82,7 @@ class Lesson(models.Model):
         blank=True,
         null=True
     )
+    image_variants = models.JSONField('Копии изображения', default=dict, blank=True, editable=False)
     video_url = models.URLField(
         'Ссылка на видео',
         blank=True,
@@ -85,15 +102,26 @@ class Lesson(models.Model):
         help_text='Чем меньше число, тем раньше показывается урок'
     )
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Урок'
         verbose_name_plural = 'Уроки'
         ordering = ['order_num']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='lesson_search_idx'),
+        ]
 
     def __str__(self):
         return f"{self.course.title} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный курс, чтобы при переносе урока обновить оба курса
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        return instance
+
     def has_video(self):
         """Проверяет наличие видео в уроке"""
         return bool(self.video_url or self.video_file)
@@ -122,8 +150,93 @@ class LessonProgress(models.Model):
         return f"{self.user.username} - {self.lesson.title} ({self.viewed_at.strftime('%d.%m.%Y')})"
 
 
+class CourseProgress(models.Model):
+    """
+    Сводный прогресс пользователя по курсу.
+
+    Обновляется инкрементально при появлении LessonProgress и при
+    добавлении/удалении уроков (см. progress), полностью
+    перестраивается командой rebuild_course_progress.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='course_progress',
+        verbose_name='Пользователь'
+    )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='progress',
+        verbose_name='Курс'
+    )
+    viewed_count = models.PositiveIntegerField('Просмотрено уроков', default=0)
+    total_lessons = models.PositiveIntegerField('Всего уроков', default=0)
+    last_viewed_at = models.DateTimeField('Последний просмотр')
+
+    class Meta:
+        verbose_name = 'Прогресс по курсу'
+        verbose_name_plural = 'Прогресс по курсам'
+        unique_together = ('user', 'course')
+        indexes = [
+            models.Index(fields=['user', '-last_viewed_at'], name='courseprogress_user_recent'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.course.title} ({self.viewed_count}/{self.total_lessons})"
+
+    @property
+    def percent(self):
+        if not self.total_lessons:
+            return 0
+        return min(int(self.viewed_count / self.total_lessons * 100), 100)
+
+
 # Новые модели для тестов и экзаменов
 
+class AssessmentQuerySet(models.QuerySet):
+    """
+    Общие запросы для тестов и экзаменов: пересчёт денормализованных
+    max_score и question_count и статус прохождения для пользователя.
+    """
+
+    def _actual_totals(self):
+        field = self.model.questions.field
+        questions = field.model.objects.filter(**{field.name: OuterRef('pk')}).order_by().values(field.name)
+        return {
+            'actual_max_score': Coalesce(Subquery(questions.annotate(total=Sum('points')).values('total')), 0),
+            'actual_question_count': Coalesce(Subquery(questions.annotate(total=Count('pk')).values('total')), 0),
+        }
+
+    def with_actual_totals(self):
+        return self.annotate(**self._actual_totals())
+
+    def refresh_totals(self):
+        """Пересчитывает итоги одним UPDATE, возвращает число обновлённых строк."""
+        totals = self._actual_totals()
+        return self.update(max_score=totals['actual_max_score'], question_count=totals['actual_question_count'])
+
+    def with_user_status(self, user):
+        """
+        Добавляет к каждой записи статус пользователя одним запросом:
+        attempted, passed (по последней попытке), best_score и last_attempt_at.
+        Для анонимного пользователя queryset возвращается без изменений.
+        """
+        if not user.is_authenticated:
+            return self
+        field = self.model.attempts.field
+        attempts = field.model.objects.filter(
+            user=user, completed_at__isnull=False, **{field.name: OuterRef('pk')}
+        ).order_by()
+        latest = attempts.order_by('-completed_at')
+        return self.annotate(
+            attempted=Exists(attempts),
+            passed=Coalesce(Subquery(latest.values('passed')[:1]), False),
+            last_attempt_at=Subquery(latest.values('completed_at')[:1]),
+            best_score=Subquery(attempts.values(field.name).annotate(best=Max('score')).values('best')),
+        )
+
+
 class Test(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='tests', verbose_name='Курс')
     title = models.CharField('Название теста', max_length=200)
@@ -131,6 +244,13 @@ class Test(models.Model):
     time_limit = models.PositiveIntegerField('Лимит времени (минут)', default=0, help_text='0 - без ограничения')
     passing_score = models.PositiveIntegerField('Проходной балл (%)', default=70)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    # Увеличивается при любом изменении вопросов и вариантов (см. answer_keys)
+    answer_key_version = models.PositiveIntegerField('Версия ключа ответов', default=0, editable=False)
+    # Поддерживаются сигналами при сохранении и удалении вопросов
+    max_score = models.PositiveIntegerField('Максимальный балл', default=0, editable=False)
+    question_count = models.PositiveIntegerField('Количество вопросов', default=0, editable=False)
+
+    objects = AssessmentQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Тест'
@@ -141,7 +261,7 @@ class Test(models.Model):
         return f"{self.course.title} - {self.title}"
 
     def total_points(self):
-        return sum(q.points for q in self.questions.all())
+        return self.max_score
 
 
 class TestQuestion(models.Model):
@@ -149,15 +269,26 @@ class TestQuestion(models.Model):
     text = models.TextField('Текст вопроса')
     points = models.PositiveIntegerField('Баллы', default=1)
     order = models.PositiveIntegerField('Порядок', default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Вопрос теста'
         verbose_name_plural = 'Вопросы теста'
         ordering = ['order']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='testquestion_search_idx'),
+        ]
 
     def __str__(self):
         return self.text[:50]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный тест, чтобы при переносе вопроса обновить оба
+        instance._loaded_test_id = instance.__dict__.get('test_id')
+        return instance
+
 
 class TestChoiceOption(models.Model):
     question = models.ForeignKey(TestQuestion, on_delete=models.CASCADE, related_name='options', verbose_name='Вопрос')
@@ -199,9 +330,12 @@ class TestAnswer(models.Model):
         verbose_name_plural = 'Ответы на тесты'
 
     def is_correct(self):
-        correct_options = set(self.question.options.filter(is_correct=True))
-        selected = set(self.selected_options.all())
-        return correct_options == selected
+        from .answer_keys import get_test_key
+        key = get_test_key(self.attempt.test)
+        if self.question_id not in key:
+            return False
+        selected = self.selected_options.values_list('id', flat=True)
+        return key[self.question_id].is_correct(selected)
 
     def points_earned(self):
         if self.is_correct():
@@ -216,6 +350,13 @@ class Exam(models.Model):
     passing_score = models.PositiveIntegerField('Проходной балл (%)', default=70)
     allow_retake = models.BooleanField('Разрешить пересдачу', default=False)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    # Увеличивается при любом изменении вопросов и эталонов (см. answer_keys)
+    answer_key_version = models.PositiveIntegerField('Версия ключа ответов', default=0, editable=False)
+    # Поддерживаются сигналами при сохранении и удалении вопросов
+    max_score = models.PositiveIntegerField('Максимальный балл', default=0, editable=False)
+    question_count = models.PositiveIntegerField('Количество вопросов', default=0, editable=False)
+
+    objects = AssessmentQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Экзамен'
@@ -226,7 +367,7 @@ class Exam(models.Model):
         return f"{self.course.title} - {self.title}"
 
     def total_points(self):
-        return sum(q.points for q in self.questions.all())
+        return self.max_score
 
 
 class ExamQuestion(models.Model):
@@ -239,15 +380,26 @@ class ExamQuestion(models.Model):
     text = models.TextField('Текст вопроса')
     points = models.PositiveIntegerField('Баллы', default=1)
     order = models.PositiveIntegerField('Порядок', default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Вопрос экзамена'
         verbose_name_plural = 'Вопросы экзамена'
         ordering = ['order']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='examquestion_search_idx'),
+        ]
 
     def __str__(self):
         return self.text[:50]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный экзамен, чтобы при переносе вопроса обновить оба
+        instance._loaded_exam_id = instance.__dict__.get('exam_id')
+        return instance
+
 
 class ExamChoiceOption(models.Model):
     question = models.ForeignKey(ExamQuestion, on_delete=models.CASCADE, related_name='options', verbose_name='Вопрос')
@@ -302,24 +454,14 @@ class ExamAnswer(models.Model):
         verbose_name_plural = 'Ответы на экзамены'
 
     def points_earned(self):
-        if self.question.type == 'choice':
-            correct_options = set(self.question.options.filter(is_correct=True))
-            selected = set(self.selected_options.all())
-            if correct_options == selected:
-                return self.question.points
-            return 0
-        else:  # text
-            # Получаем эталонный ответ (может быть несколько через |)
-            try:
-                correct = self.question.text_answers.first().correct_answer
-                # Разделяем по |, убираем пробелы по краям, приводим к нижнему регистру
-                correct_variants = [v.strip().lower() for v in correct.split('|')]
-                user_answer = self.text_answer.strip().lower()
-                if user_answer in correct_variants:
-                    return self.question.points
-            except AttributeError:
-                pass
+        from .answer_keys import get_exam_key
+        key = get_exam_key(self.attempt.exam)
+        if self.question_id not in key:
             return 0
+        question_key = key[self.question_id]
+        if question_key.type == 'choice':
+            return question_key.points_for(self.selected_options.values_list('id', flat=True))
+        return question_key.points_for(text=self.text_answer)
 """Добавление запроса на регистрацию"""
 class RegistrationRequest(models.Model):
     STATUS_CHOICES = (
@@ -338,4 +480,42 @@ class RegistrationRequest(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"{self.user.username} - {self.get_status_display()}"
\ No newline at end of file
+        return f"{self.user.username} - {self.get_status_display()}"
+
+class RegistrationBatchJob(models.Model):
+    """Фоновое рассмотрение большой выборки заявок (см. courses.registrations)."""
+    ACTION_CHOICES = (
+        ('approve', 'Одобрение'),
+        ('reject', 'Отклонение'),
+    )
+    STATUS_CHOICES = (
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Завершено'),
+        ('failed', 'Ошибка'),
+    )
+    action = models.CharField('Действие', max_length=10, choices=ACTION_CHOICES)
+    status = models.CharField('Статус', max_length=10, choices=STATUS_CHOICES, default='queued')
+    # Выбранные заявки в порядке обработки; processed - сколько из них уже пройдено
+    request_ids = models.JSONField('Заявки', default=list, editable=False)
+    total = models.PositiveIntegerField('Выбрано заявок', default=0)
+    processed = models.PositiveIntegerField('Обработано', default=0)
+    changed = models.PositiveIntegerField('Одобрено или отклонено', default=0)
+    error = models.TextField('Ошибка', blank=True)
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Запустил'
+    )
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+    updated_at = models.DateTimeField('Обновлено', default=timezone.now)
+    finished_at = models.DateTimeField('Завершено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Пакетное рассмотрение заявок'
+        verbose_name_plural = 'Пакетные рассмотрения заявок'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_action_display()} №{self.pk}: {self.processed} из {self.total}"
+
+    def progress(self):
+        return int(self.processed / self.total * 100) if self.total else 100
@@ -0,0 +1,89 @@
+"""
+Оглавление курса: упорядоченный список уроков без их содержимого.
+
+Оглавление хранится в памяти воркера и пересобирается только при смене
+Course.outline_version, которую увеличивают сигналы сохранения и удаления
+уроков. Навигация «предыдущий/следующий», номер урока и боковая панель
+строятся по оглавлению без загрузки строк Lesson.
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import F
+
+from .caching import VersionedLRUCache
+from .models import Course, Lesson
+
+
+OutlineItem = namedtuple('OutlineItem', ['id', 'title', 'order_num', 'has_video'])
+
+
+class CourseOutline:
+    """Неизменяемое оглавление курса с поиском позиции урока за O(1)."""
+
+    def __init__(self, items):
+        self.items = tuple(items)
+        self._positions = {item.id: index for index, item in enumerate(self.items)}
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def position(self, lesson_id):
+        """Номер урока в курсе, начиная с 1, или None."""
+        index = self._positions.get(lesson_id)
+        return None if index is None else index + 1
+
+    def neighbours(self, lesson_id):
+        """Возвращает пару (предыдущий, следующий) урок или None на краях."""
+        index = self._positions.get(lesson_id)
+        if index is None:
+            return None, None
+        prev_item = self.items[index - 1] if index > 0 else None
+        next_item = self.items[index + 1] if index + 1 < len(self.items) else None
+        return prev_item, next_item
+
+
+def _outline_rows(course_id):
+    return (
+        Lesson.objects.filter(course_id=course_id)
+        .order_by('order_num', 'pk')
+        .values_list('id', 'title', 'order_num', 'video_url', 'video_file')
+    )
+
+
+def _outline_item(row):
+    pk, title, order_num, video_url, video_file = row
+    return OutlineItem(pk, title, order_num, bool(video_url or video_file))
+
+
+def build_outline(course_id):
+    return CourseOutline(_outline_item(row) for row in _outline_rows(course_id))
+
+
+_cache = VersionedLRUCache(getattr(settings, 'COURSE_OUTLINE_CACHE_SIZE', 512))
+
+
+def get_course_outline(course):
+    """Возвращает оглавление курса, собирая его при первом обращении к версии."""
+    return _cache.get_or_build(course.pk, course.outline_version, lambda: build_outline(course.pk))
+
+
+async def aget_course_outline(course):
+    """Асинхронный вариант get_course_outline: оглавление читается через async for."""
+    outline = _cache.get(course.pk, course.outline_version)
+    if outline is None:
+        outline = CourseOutline([_outline_item(row) async for row in _outline_rows(course.pk)])
+        _cache.set(course.pk, course.outline_version, outline)
+    return outline
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def bump_outline_version(*course_ids):
+    Course.objects.filter(pk__in=course_ids).update(outline_version=F('outline_version') + 1)
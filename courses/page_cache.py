@@ -0,0 +1,168 @@
+"""
+Кэш страниц каталога для анонимных пользователей.
+
+Сохранённая страница помечается версией контента. Версию увеличивают
+сигналы сохранения и удаления курсов, уроков, тестов и экзаменов, так что
+правки видны сразу. Пока один воркер пересобирает устаревшую страницу,
+остальные отдают её прежнюю копию. Страница пересобирается по основной
+БД, даже если представление читает с реплики: иначе отстающая реплика
+сохранила бы под новой версией старое содержимое.
+"""
+
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from geology_education import db_router
+
+
+VERSION_KEY = 'page_cache:version'
+STATS = ('hits', 'misses', 'stale')
+
+
+# Версия - время последней правки в наносекундах, а не счётчик: если ключ
+# вытеснят из кэша, новая версия не совпадёт ни с одной прежней, и
+# сохранённые страницы не сочтутся свежими после правки
+def get_content_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_content_version():
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def _count(name):
+    key = f'page_cache:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def page_cache_stats():
+    """Возвращает счётчики попаданий, промахов и отдач устаревшей копии."""
+    values = cache.get_many([f'page_cache:{name}' for name in STATS])
+    stats = {name: values.get(f'page_cache:{name}', 0) for name in STATS}
+    served = stats['hits'] + stats['stale']
+    total = served + stats['misses']
+    stats['hit_rate'] = served / total if total else 0.0
+    return stats
+
+
+def reset_page_cache_stats():
+    cache.delete_many([f'page_cache:{name}' for name in STATS])
+
+
+def _is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # Страница с сообщением (например, «Вы вышли из системы») персональна
+    return not len(get_messages(request))
+
+
+def _build_response(entry, state):
+    _, _, content_type, content = entry
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Page-Cache'] = state
+    return response
+
+
+def _lookup(request):
+    """
+    Возвращает пару (ответ из кэша, None) или (None, ключи) при промахе.
+
+    При промахе вызывающий собирает страницу, сохраняет её через _store
+    и снимает блокировку через _release.
+    """
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f'page_cache:page:{digest}'
+    lock_key = f'page_cache:lock:{digest}'
+    version = get_content_version()
+    entry = cache.get(key)
+
+    if entry is not None:
+        entry_version, created = entry[0], entry[1]
+        if entry_version == version and time.time() - created < settings.PAGE_CACHE_TIMEOUT:
+            _count('hits')
+            return _build_response(entry, 'hit'), None
+        if not cache.add(lock_key, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            _count('stale')
+            return _build_response(entry, 'stale'), None
+    else:
+        cache.add(lock_key, 1, settings.PAGE_CACHE_LOCK_TIMEOUT)
+
+    _count('misses')
+    db_router.use_primary()
+    return None, (key, lock_key, version)
+
+
+def _store(keys, response):
+    key, _, version = keys
+    if response.status_code == 200 and not response.streaming and not response.cookies:
+        cache.set(
+            key,
+            (version, time.time(), response['Content-Type'], response.content),
+            settings.PAGE_CACHE_STALE_TIMEOUT,
+        )
+        response['X-Page-Cache'] = 'miss'
+
+
+def _release(keys):
+    cache.delete(keys[1])
+
+
+def cache_anonymous_page(view_func):
+    """
+    Декоратор представления: отдаёт анонимным пользователям сохранённую страницу.
+
+    Копия свежая, пока совпадает версия контента и не прошло
+    PAGE_CACHE_TIMEOUT секунд. Устаревшую копию отдаём, если её уже
+    пересобирает другой воркер (не дольше PAGE_CACHE_STALE_TIMEOUT).
+    Подходит и для асинхронных представлений: обращения к кэшу и сессии
+    тогда выполняются через sync_to_async.
+    """
+
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _async_wrapped_view(request, *args, **kwargs):
+            if not await sync_to_async(_is_cacheable_request)(request):
+                return await view_func(request, *args, **kwargs)
+            cached, keys = await sync_to_async(_lookup)(request)
+            if cached is not None:
+                return cached
+            try:
+                response = await view_func(request, *args, **kwargs)
+                await sync_to_async(_store)(keys, response)
+            finally:
+                await sync_to_async(_release)(keys)
+            return response
+
+        return _async_wrapped_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not _is_cacheable_request(request):
+            return view_func(request, *args, **kwargs)
+        cached, keys = _lookup(request)
+        if cached is not None:
+            return cached
+        try:
+            response = view_func(request, *args, **kwargs)
+            _store(keys, response)
+        finally:
+            _release(keys)
+        return response
+
+    return _wrapped_view
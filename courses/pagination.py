@@ -0,0 +1,109 @@
+"""
+Постраничный вывод.
+
+Каталог листается по ключу (keyset/cursor): вместо OFFSET следующая
+страница начинается сразу после последней записи предыдущей по паре
+(дата, id), поэтому любая страница стоит столько же, сколько первая, при
+наличии индекса по этой паре.
+
+Списки админки по большим таблицам используют EstimatedCountPaginator:
+точный COUNT(*) по миллионам строк читает всю таблицу, поэтому для больших
+выборок число записей берётся из оценки планировщика PostgreSQL.
+"""
+
+import base64
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor'])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(value)
+        return parsed, int(pk)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def _page_queryset(queryset, cursor, page_size, field):
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        # Условие на field отдельно позволяет БД читать диапазон индекса
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}),
+            **{f'{field}__lte': value},
+        )
+    return queryset[:page_size + 1]
+
+
+def _make_page(items, page_size, field):
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return KeysetPage(items, next_cursor)
+
+
+def keyset_paginate(queryset, cursor, page_size, field='created_at'):
+    """
+    Возвращает KeysetPage с записями в порядке (-field, -pk).
+
+    cursor — значение next_cursor предыдущей страницы или пустое
+    значение для первой страницы. Некорректный курсор вызывает InvalidCursor.
+    """
+    items = list(_page_queryset(queryset, cursor, page_size, field))
+    return _make_page(items, page_size, field)
+
+
+async def akeyset_paginate(queryset, cursor, page_size, field='created_at'):
+    """Асинхронный вариант keyset_paginate."""
+    items = [item async for item in _page_queryset(queryset, cursor, page_size, field)]
+    return _make_page(items, page_size, field)
+
+
+def estimate_count(queryset):
+    """Число строк выборки по оценке планировщика PostgreSQL (EXPLAIN, без выполнения)."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator, считающий записи точно, только если по оценке их не больше
+    ADMIN_EXACT_COUNT_LIMIT; иначе число записей (и страниц) приблизительное.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = estimate_count(queryset)
+            if estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
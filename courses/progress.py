@@ -0,0 +1,307 @@
+"""
+Учёт прогресса по курсам.
+
+CourseProgress хранит для пары (пользователь, курс) число просмотренных
+уроков, общее число уроков и время последнего просмотра. Счётчики
+обновляются инкрементально, без пересчёта всей истории пользователя.
+
+Просмотры уроков записываются отложенно: представление кладёт их в буфер
+воркера (LessonViewBuffer), который сбрасывается пакетами по размеру,
+по времени и при завершении воркера.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, DateTimeField, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Lesson, LessonProgress, CourseProgress
+
+
+def lesson_count_subquery():
+    lessons = Lesson.objects.filter(course=OuterRef('course')).order_by().values('course')
+    return Coalesce(Subquery(lessons.annotate(total=Count('pk')).values('total')), 0)
+
+
+def viewed_count_subquery():
+    views = LessonProgress.objects.filter(user=OuterRef('user'), lesson__course=OuterRef('course')).order_by().values('user')
+    return Coalesce(Subquery(views.annotate(total=Count('pk')).values('total')), 0)
+
+
+def record_views(views):
+    """
+    Учитывает новые просмотры уроков.
+
+    views — последовательность (user_id, lesson_id, viewed_at) только для
+    впервые созданных строк LessonProgress.
+    """
+    views = list(views)
+    if not views:
+        return
+    lesson_courses = dict(
+        Lesson.objects.filter(pk__in={lesson_id for _, lesson_id, _ in views}).values_list('pk', 'course_id')
+    )
+    groups = defaultdict(lambda: [0, None])
+    for user_id, lesson_id, viewed_at in views:
+        course_id = lesson_courses.get(lesson_id)
+        if course_id is None:
+            continue
+        group = groups[(user_id, course_id)]
+        group[0] += 1
+        group[1] = viewed_at if group[1] is None else max(group[1], viewed_at)
+    for (user_id, course_id), (count, viewed_at) in groups.items():
+        bump_course_progress(user_id, course_id, count, viewed_at)
+
+
+def bump_course_progress(user_id, course_id, count, viewed_at):
+    """Увеличивает счётчик просмотров курса, создавая строку при первом просмотре."""
+    def update():
+        return CourseProgress.objects.filter(user_id=user_id, course_id=course_id).update(
+            viewed_count=F('viewed_count') + count,
+            last_viewed_at=Greatest('last_viewed_at', Value(viewed_at, output_field=DateTimeField())),
+        )
+
+    if update():
+        return
+    try:
+        with transaction.atomic():
+            CourseProgress.objects.create(
+                user_id=user_id,
+                course_id=course_id,
+                viewed_count=count,
+                total_lessons=Lesson.objects.filter(course_id=course_id).count(),
+                last_viewed_at=viewed_at,
+            )
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        update()
+
+
+def delete_views(queryset):
+    """
+    Удаляет строки LessonProgress выборки и пересчитывает счётчики
+    затронутых курсов одним UPDATE; возвращает число удалённых строк.
+
+    При каскадном удалении пользователя или курса строки CourseProgress
+    удаляются тем же каскадом, при удалении урока курс пересчитывает
+    refresh_course_progress.
+    """
+    with transaction.atomic():
+        pairs = set(queryset.order_by().values_list('user_id', 'lesson__course_id').distinct())
+        deleted, _ = queryset.delete()
+        if pairs:
+            user_ids, course_ids = zip(*pairs)
+            CourseProgress.objects.filter(user_id__in=user_ids, course_id__in=course_ids).update(
+                viewed_count=viewed_count_subquery(),
+            )
+    return deleted
+
+
+def refresh_total_lessons(course_id):
+    """Обновляет число уроков во всех строках прогресса курса одним UPDATE."""
+    CourseProgress.objects.filter(course_id=course_id).update(total_lessons=lesson_count_subquery())
+
+
+def refresh_course_progress(course_id):
+    """Пересчитывает число уроков и просмотров во всех строках прогресса курса одним UPDATE."""
+    CourseProgress.objects.filter(course_id=course_id).update(
+        total_lessons=lesson_count_subquery(), viewed_count=viewed_count_subquery(),
+    )
+
+
+def rebuild_course_progress(batch_size=1000):
+    """
+    Полностью перестраивает CourseProgress по LessonProgress.
+
+    Возвращает число созданных строк.
+    """
+    totals = dict(
+        Lesson.objects.order_by().values('course_id').annotate(total=Count('pk')).values_list('course_id', 'total')
+    )
+    rows = (
+        LessonProgress.objects.order_by()
+        .values('user_id', 'lesson__course_id')
+        .annotate(viewed=Count('pk'), last_viewed=Max('viewed_at'))
+    )
+    created = 0
+    batch = []
+    with transaction.atomic():
+        CourseProgress.objects.all().delete()
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(CourseProgress(
+                user_id=row['user_id'],
+                course_id=row['lesson__course_id'],
+                viewed_count=row['viewed'],
+                total_lessons=totals.get(row['lesson__course_id'], 0),
+                last_viewed_at=row['last_viewed'],
+            ))
+            if len(batch) >= batch_size:
+                CourseProgress.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        CourseProgress.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+# ----- Отложенная запись просмотров -----
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'recorded_lessons'
+
+
+def remember_view(request, lesson_id):
+    """
+    Отмечает урок в сессии пользователя.
+
+    Возвращает False, если просмотр в этой сессии уже был учтён.
+    """
+    recorded = request.session.get(SESSION_KEY, [])
+    if lesson_id in recorded:
+        return False
+    request.session[SESSION_KEY] = recorded + [lesson_id]
+    return True
+
+
+def insert_views(views):
+    """
+    Вставляет просмотры одним INSERT ... ON CONFLICT DO NOTHING.
+
+    views — словарь {(user_id, lesson_id): viewed_at}. Для реально
+    вставленных строк обновляет CourseProgress, возвращает их число.
+    """
+    if not views:
+        return 0
+    meta = LessonProgress._meta
+    using = router.db_for_write(LessonProgress)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = [quote(meta.get_field(name).column) for name in ('user', 'lesson', 'viewed_at')]
+    user_column, lesson_column, _ = columns
+    params = []
+    for (user_id, lesson_id), viewed_at in views.items():
+        params += [user_id, lesson_id, connection.ops.adapt_datetimefield_value(viewed_at)]
+    sql = (
+        f'INSERT INTO {quote(meta.db_table)} ({", ".join(columns)}) '
+        f'VALUES {", ".join(["(%s, %s, %s)"] * len(views))} '
+        f'ON CONFLICT ({user_column}, {lesson_column}) DO NOTHING '
+        f'RETURNING {user_column}, {lesson_column}'
+    )
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            inserted = cursor.fetchall()
+        record_views(
+            (user_id, lesson_id, views[(user_id, lesson_id)]) for user_id, lesson_id in inserted
+        )
+    return len(inserted)
+
+
+class LessonViewBuffer:
+    """
+    Буфер просмотров уроков в памяти воркера.
+
+    Сбрасывается фоновым потоком, когда набирается
+    LESSON_PROGRESS_FLUSH_BATCH_SIZE просмотров или проходит
+    LESSON_PROGRESS_FLUSH_INTERVAL секунд, а также при завершении процесса.
+    При интервале 0 фонового потока нет и сброс по размеру выполняется сразу.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread_pid = None
+
+    @property
+    def batch_size(self):
+        return max(getattr(settings, 'LESSON_PROGRESS_FLUSH_BATCH_SIZE', 200), 1)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'LESSON_PROGRESS_FLUSH_INTERVAL', 5)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def clear(self):
+        """Отбрасывает накопленные просмотры без записи."""
+        with self._lock:
+            self._pending = {}
+
+    def add(self, user_id, lesson_id, viewed_at=None):
+        with self._lock:
+            self._pending.setdefault((user_id, lesson_id), viewed_at or timezone.now())
+            full = len(self._pending) >= self.batch_size
+        if self._ensure_thread():
+            if full:
+                self._wakeup.set()
+        elif full:
+            self.flush()
+
+    def flush(self):
+        """Записывает всё накопленное, возвращает число новых строк."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            items = list(pending.items())
+            inserted = 0
+            for start in range(0, len(items), self.batch_size):
+                chunk = dict(items[start:start + self.batch_size])
+                try:
+                    try:
+                        inserted += insert_views(chunk)
+                    except IntegrityError:
+                        # Урок или пользователь удалены, пока просмотр ждал в буфере
+                        inserted += insert_views(self._existing(chunk))
+                except Exception:
+                    # БД недоступна: возвращаем незаписанное в буфер до следующего сброса
+                    with self._lock:
+                        for key, viewed_at in items[start:]:
+                            self._pending.setdefault(key, viewed_at)
+                    raise
+            return inserted
+
+    def _existing(self, views):
+        lesson_ids = set(Lesson.objects.filter(pk__in={key[1] for key in views}).values_list('pk', flat=True))
+        user_ids = set(
+            LessonProgress._meta.get_field('user').related_model.objects
+            .filter(pk__in={key[0] for key in views}).values_list('pk', flat=True)
+        )
+        return {key: value for key, value in views.items() if key[0] in user_ids and key[1] in lesson_ids}
+
+    def _ensure_thread(self):
+        """Запускает фоновый поток в текущем процессе, если он нужен."""
+        if self.interval <= 0:
+            return False
+        # После fork поток родителя не существует, поэтому сверяем pid
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return True
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='lesson-view-flusher', daemon=True).start()
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать просмотры уроков')
+            finally:
+                connections.close_all()
+
+
+lesson_view_buffer = LessonViewBuffer()
+atexit.register(lesson_view_buffer.flush)
@@ -0,0 +1,110 @@
+"""
+Рассмотрение заявок на регистрацию.
+
+Одобрение и отклонение выполняются несколькими запросами UPDATE/DELETE
+на всю выборку в одной транзакции, а не циклом по заявкам. Рассматриваются
+только ожидающие заявки, поэтому повторная обработка ничего не меняет.
+
+Выборки больше REGISTRATION_BULK_SYNC_LIMIT заявок админка передаёт
+фоновому заданию RegistrationBatchJob: оно выполняется в отдельном потоке
+воркера пакетами по REGISTRATION_JOB_BATCH_SIZE заявок, каждый пакет - в
+своей транзакции вместе с отметкой прогресса. Задание, прерванное
+перезапуском воркера, продолжает команда run_registration_jobs.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import RegistrationRequest, RegistrationBatchJob
+
+
+logger = logging.getLogger(__name__)
+
+
+def approve_requests(queryset):
+    """Одобряет ожидающие заявки выборки и активирует пользователей; возвращает число одобренных."""
+    with transaction.atomic():
+        rows = list(queryset.filter(status='pending').select_for_update().values_list('pk', 'user_id'))
+        if not rows:
+            return 0
+        request_ids, user_ids = zip(*rows)
+        User.objects.filter(pk__in=user_ids).update(is_active=True)
+        return RegistrationRequest.objects.filter(pk__in=request_ids).update(status='approved', reviewed_at=timezone.now())
+
+
+def reject_requests(queryset):
+    """
+    Отклоняет ожидающие заявки выборки: удаляет пользователей, заявки и
+    профили удаляются каскадно. Возвращает число отклонённых заявок.
+    """
+    with transaction.atomic():
+        user_ids = list(queryset.filter(status='pending').select_for_update().values_list('user_id', flat=True))
+        if not user_ids:
+            return 0
+        _, deleted = User.objects.filter(pk__in=user_ids).delete()
+        return deleted.get(RegistrationRequest._meta.label, 0)
+
+
+ACTIONS = {
+    'approve': approve_requests,
+    'reject': reject_requests,
+}
+
+
+def queue_job(action, queryset, user):
+    """Создаёт задание по ожидающим заявкам выборки и запускает его после фиксации транзакции."""
+    request_ids = list(queryset.filter(status='pending').order_by('pk').values_list('pk', flat=True))
+    job = RegistrationBatchJob.objects.create(
+        action=action, request_ids=request_ids, total=len(request_ids), created_by=user,
+    )
+    transaction.on_commit(lambda: start_job(job.pk))
+    return job
+
+
+def start_job(job_id):
+    threading.Thread(target=_run_in_thread, args=(job_id,), name=f'registration-job-{job_id}', daemon=True).start()
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Соединения потока сами не закрываются (возвращаются в пул)
+        connections.close_all()
+
+
+def claimable_jobs():
+    """Задания в очереди и выполняющиеся, но давно не отмечавшие прогресс (воркер остановлен)."""
+    stale_before = timezone.now() - timedelta(seconds=settings.REGISTRATION_JOB_STALE_SECONDS)
+    return RegistrationBatchJob.objects.filter(Q(status='queued') | Q(status='running', updated_at__lt=stale_before))
+
+
+def run_job(job_id):
+    """Выполняет задание с места остановки; False, если его уже выполняет другой процесс."""
+    if not claimable_jobs().filter(pk=job_id).update(status='running', updated_at=timezone.now()):
+        return False
+    job = RegistrationBatchJob.objects.get(pk=job_id)
+    action = ACTIONS[job.action]
+    batch_size = settings.REGISTRATION_JOB_BATCH_SIZE
+    try:
+        for start in range(job.processed, job.total, batch_size):
+            batch = job.request_ids[start:start + batch_size]
+            with transaction.atomic():
+                changed = action(RegistrationRequest.objects.filter(pk__in=batch))
+                RegistrationBatchJob.objects.filter(pk=job_id).update(
+                    processed=F('processed') + len(batch), changed=F('changed') + changed, updated_at=timezone.now(),
+                )
+    except Exception as error:
+        logger.exception('Задание %s по заявкам на регистрацию прервано', job_id)
+        RegistrationBatchJob.objects.filter(pk=job_id).update(status='failed', error=repr(error), updated_at=timezone.now())
+        return True
+    now = timezone.now()
+    RegistrationBatchJob.objects.filter(pk=job_id).update(status='done', updated_at=now, finished_at=now)
+    return True
@@ -0,0 +1,61 @@
+"""
+Определение ролей пользователя.
+
+Роли (администратор, студент) и профиль студента вычисляются один раз
+и хранятся в общем кэше. Сигналы изменения групп, пользователя и профиля
+удаляют запись, так что следующий запрос вычислит роли заново.
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import StudentProfile
+
+
+ADMIN_GROUP = 'Администратор'
+STUDENT_GROUP = 'Студент'
+
+UserRoles = namedtuple('UserRoles', ['is_admin', 'is_student', 'student_profile'])
+
+ANONYMOUS_ROLES = UserRoles(is_admin=False, is_student=False, student_profile=None)
+
+
+def cache_key(user_id):
+    return f'user_roles:{user_id}'
+
+
+def compute_user_roles(user):
+    groups = set(user.groups.filter(name__in=[ADMIN_GROUP, STUDENT_GROUP]).values_list('name', flat=True))
+    return UserRoles(
+        is_admin=user.is_superuser or ADMIN_GROUP in groups,
+        is_student=STUDENT_GROUP in groups,
+        student_profile=StudentProfile.objects.filter(user=user).first(),
+    )
+
+
+def get_user_roles(user):
+    """
+    Возвращает UserRoles пользователя.
+
+    Результат запоминается на объекте пользователя (на время запроса)
+    и в кэше (до инвалидации или ROLE_CACHE_TIMEOUT секунд).
+    """
+    if not user.is_authenticated:
+        return ANONYMOUS_ROLES
+    roles = getattr(user, '_roles_cache', None)
+    if roles is None:
+        key = cache_key(user.pk)
+        roles = cache.get(key)
+        if roles is None:
+            roles = compute_user_roles(user)
+            cache.set(key, roles, getattr(settings, 'ROLE_CACHE_TIMEOUT', 3600))
+        user._roles_cache = roles
+    return roles
+
+
+def invalidate_user_roles(user_ids):
+    user_ids = list(user_ids)
+    if user_ids:
+        cache.delete_many([cache_key(user_id) for user_id in user_ids])
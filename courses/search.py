@@ -0,0 +1,110 @@
+"""
+Полнотекстовый поиск (PostgreSQL, конфигурация russian).
+
+Поисковые векторы хранятся в столбцах search_vector с GIN-индексами и
+обновляются сигналами при сохранении. Для массовых загрузок, обходящих
+сигналы, есть команда rebuild_search_index.
+"""
+
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connections, router
+from django.db.models import F
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Course, Lesson, TestQuestion, ExamQuestion
+
+
+SEARCH_CONFIG = 'russian'
+
+# Поля модели и их веса в поисковом векторе
+SEARCH_FIELDS = {
+    Course: (('title', 'A'), ('description', 'B')),
+    Lesson: (('title', 'A'), ('content', 'B')),
+    TestQuestion: (('text', 'A'),),
+    ExamQuestion: (('text', 'A'),),
+}
+
+WORD_RE = re.compile(r'\w+')
+
+# Маркеры подсветки заменяются на <mark> после экранирования текста
+START_SEL, STOP_SEL = '\x02', '\x03'
+
+
+def is_supported(model):
+    return connections[router.db_for_write(model)].vendor == 'postgresql'
+
+
+def search_vector_for(model):
+    vector = None
+    for name, weight in SEARCH_FIELDS[model]:
+        part = SearchVector(name, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vectors(model, **lookup):
+    """Пересчитывает векторы записей одним UPDATE, возвращает их число."""
+    if not is_supported(model):
+        return 0
+    return model.objects.filter(**lookup).update(search_vector=search_vector_for(model))
+
+
+def make_query(text):
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def make_prefix_query(text):
+    """
+    Запрос, в котором каждое слово - начало слова текста («Минер» находит
+    «Минералогия»), все слова обязательны. None, если слов нет.
+    """
+    words = WORD_RE.findall(text)
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f"'{word}':*" for word in words), config=SEARCH_CONFIG, search_type='raw')
+
+
+def highlight(text):
+    """Экранирует фрагмент ts_headline и оформляет найденные слова тегом <mark>."""
+    return mark_safe(escape(text).replace(START_SEL, '<mark>').replace(STOP_SEL, '</mark>'))
+
+
+def ranked(queryset, query, headline_field):
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline(
+                headline_field, query, config=SEARCH_CONFIG,
+                start_sel=START_SEL, stop_sel=STOP_SEL, max_words=35, min_words=15,
+            ),
+        )
+        .order_by('-rank', '-pk')
+    )
+
+
+def search(text, limit=None):
+    """
+    Ищет по курсам, урокам и вопросам.
+
+    Возвращает словарь {'courses', 'lessons', 'test_questions', 'exam_questions'}
+    со списками записей, у каждой есть rank и headline (уже подсвеченный).
+    """
+    limit = limit or getattr(settings, 'SEARCH_RESULTS_LIMIT', 20)
+    query = make_query(text)
+    results = {
+        'courses': ranked(Course.objects.all(), query, 'description'),
+        'lessons': ranked(Lesson.objects.select_related('course').defer('course__description'), query, 'content'),
+        'test_questions': ranked(TestQuestion.objects.select_related('test'), query, 'text'),
+        'exam_questions': ranked(ExamQuestion.objects.select_related('exam'), query, 'text'),
+    }
+    for key, queryset in results.items():
+        items = list(queryset[:limit])
+        for item in items:
+            item.headline = highlight(item.headline)
+        results[key] = items
+    return results
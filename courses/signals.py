@@ -0,0 +1,157 @@
+"""
+Обработчики сигналов приложения courses.
+
+Подключаются в CoursesConfig.ready().
+"""
+
+from django.contrib.auth.models import User, Group
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from geology_education.metrics import install_query_timer
+
+from .answer_keys import bump_test_version, bump_exam_version
+from .images import refresh_image_variants
+from .outline import bump_outline_version
+from .page_cache import bump_content_version
+from .progress import record_views, refresh_course_progress, refresh_total_lessons
+from .roles import invalidate_user_roles
+from .search import SEARCH_FIELDS, update_search_vectors
+from .models import (
+    StudentProfile, Course, Lesson, LessonProgress,
+    Test, TestQuestion, TestChoiceOption, Exam,
+    ExamQuestion, ExamChoiceOption, ExamTextAnswer,
+)
+
+
+# ----- Ключи ответов и итоги по вопросам -----
+def question_parents(instance, field):
+    """Тест или экзамен вопроса и, если вопрос перенесли, прежний."""
+    parents = {getattr(instance, f'{field}_id'), getattr(instance, f'_loaded_{field}_id', None)} - {None}
+    setattr(instance, f'_loaded_{field}_id', getattr(instance, f'{field}_id'))
+    return parents
+
+
+@receiver([post_save, post_delete], sender=TestQuestion)
+def test_question_changed(sender, instance, **kwargs):
+    parents = question_parents(instance, 'test')
+    Test.objects.filter(pk__in=parents).refresh_totals()
+    bump_test_version(pk__in=parents)
+
+
+@receiver([post_save, post_delete], sender=TestChoiceOption)
+def test_option_changed(sender, instance, **kwargs):
+    bump_test_version(questions=instance.question_id)
+
+
+@receiver([post_save, post_delete], sender=ExamQuestion)
+def exam_question_changed(sender, instance, **kwargs):
+    parents = question_parents(instance, 'exam')
+    Exam.objects.filter(pk__in=parents).refresh_totals()
+    bump_exam_version(pk__in=parents)
+
+
+@receiver([post_save, post_delete], sender=ExamChoiceOption)
+@receiver([post_save, post_delete], sender=ExamTextAnswer)
+def exam_option_changed(sender, instance, **kwargs):
+    bump_exam_version(questions=instance.question_id)
+
+
+# ----- Прогресс по курсам -----
+@receiver(post_save, sender=LessonProgress)
+def lesson_progress_created(sender, instance, created, **kwargs):
+    if created:
+        record_views([(instance.user_id, instance.lesson_id, instance.viewed_at)])
+
+
+# Удаление строк LessonProgress учитывает progress.delete_views: обработчик
+# post_delete отключил бы быстрое каскадное удаление
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_saved(sender, instance, created, **kwargs):
+    old_course_id = getattr(instance, '_loaded_course_id', None)
+    moved = old_course_id is not None and old_course_id != instance.course_id
+    if created or moved:
+        refresh_total_lessons(instance.course_id)
+    if moved:
+        refresh_total_lessons(old_course_id)
+        bump_outline_version(instance.course_id, old_course_id)
+    else:
+        bump_outline_version(instance.course_id)
+    instance._loaded_course_id = instance.course_id
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_deleted(sender, instance, **kwargs):
+    # Просмотры урока уже удалены каскадом
+    refresh_course_progress(instance.course_id)
+    bump_outline_version(instance.course_id)
+
+
+# ----- Роли пользователей -----
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_user_roles([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_user_roles(pk_set)
+    elif action == 'pre_clear':
+        invalidate_user_roles(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Переименование или удаление группы меняет роли всех её участников
+    if instance.pk is not None:
+        invalidate_user_roles(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user_roles([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=StudentProfile)
+def student_profile_changed(sender, instance, **kwargs):
+    invalidate_user_roles([instance.user_id])
+
+
+# ----- Кэш страниц каталога -----
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Lesson)
+@receiver([post_save, post_delete], sender=Test)
+@receiver([post_save, post_delete], sender=TestQuestion)
+@receiver([post_save, post_delete], sender=Exam)
+@receiver([post_save, post_delete], sender=ExamQuestion)
+def catalog_changed(sender, **kwargs):
+    bump_content_version()
+
+
+# ----- Полнотекстовый поиск -----
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=TestQuestion)
+@receiver(post_save, sender=ExamQuestion)
+def search_content_saved(sender, instance, update_fields=None, **kwargs):
+    # Сохранение без текстовых полей (например, только order_num) вектор не меняет
+    if update_fields is not None and not set(update_fields) & {name for name, _ in SEARCH_FIELDS[sender]}:
+        return
+    update_search_vectors(sender, pk=instance.pk)
+
+
+# ----- Копии изображений -----
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+def image_saved(sender, instance, **kwargs):
+    refresh_image_variants(instance)
+
+
+# ----- Метрики запросов -----
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # Число и время SQL-запросов для performance_middleware
+    install_query_timer(connection)
@@ -0,0 +1,241 @@
+"""
+Массовый импорт студентов из CSV или XLSX.
+
+Первая строка файла - заголовки столбцов (см. COLUMNS). Каждая строка
+создаёт то же, что форма регистрации: неактивного пользователя в группе
+«Студент», профиль студента и заявку на регистрацию, которую затем
+одобряют в админке.
+
+Строки проверяются формой StudentImportRowForm; логины сверяются с базой
+одним запросом. Ошибочные строки попадают в отчёт, остальные
+импортируются. Хэши паролей (PBKDF2 - самая долгая часть регистрации)
+считаются в пуле процессов на всех ядрах, записи вставляются пакетами
+через bulk_create без сигналов (для новых пользователей они ничего не
+пересчитывают). Если логин успели занять после проверки (например,
+регистрацией на сайте), пакет повторяется без этой строки, а строка
+попадает в отчёт.
+
+Загрузка через админку хэширует пароли в запросе, поэтому принимает не
+больше STUDENT_IMPORT_ADMIN_MAX_ROWS строк; большие файлы импортирует
+команда import_students.
+
+Для XLSX нужен пакет openpyxl.
+"""
+
+import csv
+import io
+import os
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.db import IntegrityError, transaction
+
+from .forms import StudentImportRowForm
+from .models import StudentProfile, RegistrationRequest
+from .roles import STUDENT_GROUP
+from .synthetic import batched
+
+
+# Поле формы: допустимые заголовки столбца
+COLUMNS = {
+    'username': ('username', 'логин'),
+    'first_name': ('first_name', 'имя'),
+    'last_name': ('last_name', 'фамилия'),
+    'position': ('position', 'должность'),
+    'email': ('email', 'e-mail', 'почта'),
+    'password': ('password', 'пароль'),
+}
+
+# Меньше стольких паролей на процесс пул не окупает свой запуск
+MIN_PASSWORDS_PER_WORKER = 4
+
+ImportResult = namedtuple('ImportResult', ['created', 'errors'])
+
+
+class ImportFileError(ValueError):
+    """Файл нельзя прочитать: неизвестный формат или нет нужных столбцов."""
+
+
+def _read_csv(content):
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ImportFileError('CSV должен быть в кодировке UTF-8')
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.reader(io.StringIO(text), dialect))
+
+
+def _read_xlsx(content):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportFileError('Для импорта из XLSX установите пакет openpyxl')
+    from openpyxl.utils.exceptions import InvalidFileException
+    try:
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile):
+        raise ImportFileError('Файл не похож на книгу XLSX')
+    try:
+        return [
+            ['' if value is None else str(value) for value in row]
+            for row in workbook.worksheets[0].iter_rows(values_only=True)
+        ]
+    finally:
+        workbook.close()
+
+
+def read_rows(content, filename):
+    """
+    Строки файла словарями {поле: значение} с номерами строк в файле:
+    [(номер, строка), ...]. Пустые строки пропускаются.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        table = _read_csv(content)
+    elif extension == '.xlsx':
+        table = _read_xlsx(content)
+    else:
+        raise ImportFileError(f'Неизвестный формат файла {extension or filename}: нужен CSV или XLSX')
+    if not table:
+        raise ImportFileError('Файл пуст')
+
+    headers = {title: field for field, titles in COLUMNS.items() for title in titles}
+    columns = [headers.get(title.strip().lower()) for title in table[0]]
+    required = set(COLUMNS) - {'email'}
+    if not required <= set(columns):
+        missing = ', '.join(COLUMNS[field][0] for field in COLUMNS if field in required - set(columns))
+        raise ImportFileError(f'В файле нет столбцов: {missing}')
+
+    rows = []
+    for number, values in enumerate(table[1:], start=2):
+        if not any(value.strip() for value in values):
+            continue
+        rows.append((number, {field: value.strip() for field, value in zip(columns, values) if field}))
+    return rows
+
+
+def validate(rows):
+    """
+    Проверяет строки; возвращает (верные cleaned_data с номерами строк,
+    ошибки [(номер, сообщение), ...]).
+    """
+    valid, errors = [], []
+    for number, row in rows:
+        form = StudentImportRowForm(row)
+        if form.is_valid():
+            valid.append((number, form.cleaned_data))
+        else:
+            messages = [message for field_errors in form.errors.values() for message in field_errors]
+            errors.append((number, ' '.join(messages)))
+
+    # Логины, занятые в базе или встретившиеся в файле раньше, - одним запросом
+    usernames = [data['username'] for _, data in valid]
+    taken = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    unique = []
+    for number, data in valid:
+        if data['username'] in taken:
+            errors.append((number, taken_message(data['username'])))
+        else:
+            taken.add(data['username'])
+            unique.append((number, data))
+    errors.sort()
+    return unique, errors
+
+
+def hash_passwords(passwords, workers=None):
+    """Хэши паролей в порядке passwords; для больших списков - в пуле процессов."""
+    workers = min(workers or settings.STUDENT_IMPORT_WORKERS or os.cpu_count() or 1,
+                  len(passwords) // MIN_PASSWORDS_PER_WORKER)
+    if workers <= 1:
+        return [make_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(make_password, passwords, chunksize=MIN_PASSWORDS_PER_WORKER))
+
+
+def taken_message(username):
+    return f'Пользователь с логином {username} уже существует.'
+
+
+def _insert(rows, student_group, batch_size):
+    """Вставляет пакет (номер, данные, хэш пароля) одной транзакцией; возвращает пользователей."""
+    users = [
+        User(
+            username=data['username'], email=data['email'], password=password,
+            first_name=data['first_name'], last_name=data['last_name'],
+            # Как при регистрации: вход после одобрения заявки
+            is_active=False,
+        )
+        for _, data, password in rows
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        User.groups.through.objects.bulk_create(
+            [User.groups.through(user_id=user.pk, group_id=student_group.pk) for user in users],
+            batch_size=batch_size,
+        )
+        StudentProfile.objects.bulk_create(
+            [
+                StudentProfile(
+                    user=user, first_name=data['first_name'], last_name=data['last_name'], position=data['position'],
+                )
+                for user, (_, data, _) in zip(users, rows)
+            ],
+            batch_size=batch_size,
+        )
+        RegistrationRequest.objects.bulk_create([RegistrationRequest(user=user) for user in users], batch_size=batch_size)
+    return users
+
+
+def create_students(students, batch_size=None):
+    """
+    Создаёт пользователей, профили, членство в группе и заявки по верным
+    строкам [(номер, cleaned_data), ...]. Возвращает (пользователи, ошибки
+    строк, чьи логины заняли после проверки).
+    """
+    batch_size = batch_size or settings.STUDENT_IMPORT_BATCH_SIZE
+    passwords = hash_passwords([data['password'] for _, data in students])
+    student_group, _ = Group.objects.get_or_create(name=STUDENT_GROUP)
+    users, errors = [], []
+    for batch in batched(
+        [(number, data, password) for (number, data), password in zip(students, passwords)], batch_size,
+    ):
+        while batch:
+            try:
+                users += _insert(batch, student_group, batch_size)
+                break
+            except IntegrityError:
+                # Логины заняли после validate(): повторяем пакет без них
+                taken = set(User.objects.filter(
+                    username__in=[data['username'] for _, data, _ in batch],
+                ).values_list('username', flat=True))
+                if not taken:
+                    raise
+                errors += [(number, taken_message(data['username'])) for number, data, _ in batch if data['username'] in taken]
+                batch = [row for row in batch if row[1]['username'] not in taken]
+    return users, errors
+
+
+def import_students(content, filename, dry_run=False, max_rows=None):
+    """
+    Импортирует студентов из содержимого файла. Возвращает ImportResult:
+    число созданных (при dry_run - готовых к созданию) и ошибки строк.
+    Нечитаемый файл или больше max_rows строк к созданию вызывают
+    ImportFileError.
+    """
+    students, errors = validate(read_rows(content, filename))
+    if dry_run or not students:
+        return ImportResult(len(students), errors)
+    if max_rows is not None and len(students) > max_rows:
+        raise ImportFileError(
+            f'Строк к импорту {len(students)}, здесь можно не больше {max_rows}: '
+            f'импортируйте файл командой manage.py import_students'
+        )
+    users, conflicts = create_students(students)
+    return ImportResult(len(users), sorted(errors + conflicts))
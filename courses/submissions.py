@@ -0,0 +1,123 @@
+"""
+Приём ответов на тесты и экзамены.
+
+Ответы проверяются в памяти по скомпилированному ключу ответов
+(см. answer_keys), после чего попытка, ответы и выбранные варианты
+записываются фиксированным числом запросов в одной транзакции
+(независимо от количества вопросов).
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .answer_keys import get_test_key, get_exam_key
+from .models import TestAttempt, TestAnswer, ExamAttempt, ExamAnswer
+
+
+def parse_selected(values, allowed_ids):
+    """
+    Разбирает выбранные варианты из POST.
+
+    Возвращает пару (множество допустимых id, флаг корректности).
+    Флаг сбрасывается, если прислан мусор или вариант чужого вопроса —
+    такой ответ засчитывается как неверный, как и раньше.
+    """
+    selected = set()
+    valid = True
+    for value in values:
+        try:
+            option_id = int(value)
+        except (TypeError, ValueError):
+            valid = False
+            continue
+        if option_id in allowed_ids:
+            selected.add(option_id)
+        else:
+            valid = False
+    return selected, valid
+
+
+def is_passed(score, total_points, passing_score):
+    return (score / total_points * 100) >= passing_score if total_points else False
+
+
+def submit_test(user, test, data):
+    """
+    Проверяет и сохраняет попытку прохождения теста.
+
+    data — QueryDict с полями question_<id>. Возвращает созданную TestAttempt
+    с уже посчитанными score и passed.
+    """
+    key = get_test_key(test)
+
+    score = 0
+    answers = []
+    for question_id, question_key in key.items():
+        selected, valid = parse_selected(data.getlist(f'question_{question_id}'), question_key.option_ids)
+        if valid:
+            score += question_key.points_for(selected)
+        answers.append((question_id, selected))
+
+    with transaction.atomic():
+        attempt = TestAttempt.objects.create(
+            user=user,
+            test=test,
+            score=score,
+            passed=is_passed(score, key.total_points, test.passing_score),
+            completed_at=timezone.now(),
+        )
+        created = TestAnswer.objects.bulk_create([
+            TestAnswer(attempt=attempt, question_id=question_id) for question_id, _ in answers
+        ])
+        through = TestAnswer.selected_options.through
+        through.objects.bulk_create([
+            through(testanswer_id=answer.pk, testchoiceoption_id=option_id)
+            for answer, (_, selected) in zip(created, answers)
+            for option_id in sorted(selected)
+        ])
+    return attempt
+
+
+def submit_exam(user, exam, data):
+    """
+    Проверяет и сохраняет попытку сдачи экзамена.
+
+    Для вопросов с выбором ответа берутся отмеченные варианты,
+    для текстовых — строка из поля question_<id>.
+    """
+    key = get_exam_key(exam)
+
+    score = 0
+    answers = []
+    for question_id, question_key in key.items():
+        field = f'question_{question_id}'
+        if question_key.type == 'choice':
+            selected, valid = parse_selected(data.getlist(field), question_key.option_ids)
+            text_answer = ''
+            if valid:
+                score += question_key.points_for(selected)
+        else:
+            selected = set()
+            text_answer = data.get(field, '').strip()
+            score += question_key.points_for(text=text_answer)
+        answers.append((question_id, selected, text_answer))
+
+    with transaction.atomic():
+        attempt = ExamAttempt.objects.create(
+            user=user,
+            exam=exam,
+            score=score,
+            passed=is_passed(score, key.total_points, exam.passing_score),
+            completed_at=timezone.now(),
+        )
+        created = ExamAnswer.objects.bulk_create([
+            ExamAnswer(attempt=attempt, question_id=question_id, text_answer=text_answer)
+            for question_id, _, text_answer in answers
+        ])
+        through = ExamAnswer.selected_options.through
+        through.objects.bulk_create([
+            through(examanswer_id=answer.pk, examchoiceoption_id=option_id)
+            for answer, (_, selected, _) in zip(created, answers)
+            for option_id in sorted(selected)
+        ])
+    return attempt
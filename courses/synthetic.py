@@ -0,0 +1,88 @@
+"""
+Синтетические данные для нагрузочных замеров и бенчмарков.
+
+Тексты собираются из геологических терминов, разбавленных словами-
+заполнителями, чтобы каждый термин встречался в небольшой доле записей,
+как в реальных текстах. Все функции берут случайные числа из переданного
+random.Random, поэтому результат воспроизводится по seed.
+"""
+
+from contextlib import contextmanager
+from itertools import islice
+
+
+WORDS = (
+    'порода минерал кварц полевой шпат слюда гранит базальт андезит песчаник известняк доломит '
+    'глина аргиллит сланец гнейс мрамор кварцит разлом складка пласт залежь месторождение руда '
+    'керн скважина бурение каротаж сейсморазведка гравиразведка магниторазведка разрез колонка '
+    'стратиграфия литология петрография минералогия кристалл решётка твёрдость спайность излом '
+    'блеск выветривание эрозия осадконакопление диагенез метаморфизм магматизм интрузия эффузия '
+    'лава вулкан тектоника плита мантия кора рифт надвиг сброс сдвиг антиклиналь синклиналь '
+    'ледник морена терраса аллювий пролювий делювий элювий почва грунт водоносный горизонт '
+    'фильтрация пористость проницаемость нефть газ коллектор покрышка ловушка миграция '
+    'геохимия изотоп возраст палеонтология окаменелость аммонит трилобит юрский меловой пермский '
+    'девонский кембрийский четвертичный картирование съёмка полевой маршрут обнажение образец '
+    'шлиф микроскоп анализ проба запасы категория подсчёт кондиции рудное тело жила штокверк'
+).split()
+
+SYLLABLES = 'ка ро ли те на ви мо су ге ла по ры ды ту ме ко ни жа ще зо'.split()
+
+FIRST_NAMES = (
+    'Александр Алексей Анна Андрей Валерия Виктор Дарья Дмитрий Екатерина Елена Иван Ирина '
+    'Кирилл Ксения Максим Мария Михаил Наталья Никита Ольга Павел Полина Сергей Татьяна'
+).split()
+
+LAST_NAMES = (
+    'Иванов Смирнов Кузнецов Попов Васильев Петров Соколов Михайлов Новиков Фёдоров Морозов '
+    'Волков Алексеев Лебедев Семёнов Егоров Павлов Козлов Степанов Николаев Орлов Андреев'
+).split()
+
+POSITIONS = (
+    'Студент', 'Геолог-практикант', 'Геолог', 'Ведущий геолог', 'Инженер-геофизик',
+    'Гидрогеолог', 'Маркшейдер', 'Лаборант', 'Буровой мастер', 'Аспирант',
+)
+
+
+class TextGenerator:
+    """Заголовки и абзацы из терминов и слов-заполнителей."""
+
+    def __init__(self, rng, term_share=0.1, filler_size=20000):
+        self.rng = rng
+        self.term_share = term_share
+        self.filler = [''.join(rng.choices(SYLLABLES, k=3)) for _ in range(filler_size)]
+
+    def text(self, count):
+        rng = self.rng
+        return ' '.join(
+            rng.choice(WORDS) if rng.random() < self.term_share else rng.choice(self.filler) for _ in range(count)
+        )
+
+    def title(self, count=3):
+        return ' '.join(self.rng.choices(WORDS, k=count)).capitalize()
+
+
+def batched(iterable, size):
+    """Разбивает поток объектов на списки не длиннее size (для bulk_create)."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Отключает auto_now и auto_now_add у полей моделей, чтобы bulk_create
+    сохранил заданные даты (просмотры и попытки за прошедший год), а не
+    текущее время.
+    """
+    changed = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                changed.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in changed:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
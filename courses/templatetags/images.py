@@ -0,0 +1,38 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+
+from courses.images import FORMATS, current_variants, variant_name
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, variants, sizes='100vw', **attrs):
+    """
+    Выводит <picture> с srcset по копиям изображения (WebP и JPEG).
+
+    Пример: {% responsive_image course.image course.image_variants sizes="33vw" alt=course.title class="card-img-top" %}
+    Пока копий нет, выводится обычный <img> с оригиналом.
+    """
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    extra = format_html_join(' ', '{}="{}"', attrs.items())
+    widths = current_variants(field_file.name, variants)
+    if not widths:
+        return format_html('<img src="{}" {}>', field_file.url, extra)
+
+    storage, name = field_file.storage, field_file.name
+
+    def srcset(ext):
+        return ', '.join(f'{storage.url(variant_name(name, width, ext))} {width}w' for width in widths)
+
+    default_width = next((w for w in widths if w >= settings.IMAGE_DEFAULT_WIDTH), widths[-1])
+    (_, jpeg_ext, _), (_, webp_ext, _) = FORMATS
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" {}></picture>',
+        srcset(webp_ext), sizes,
+        storage.url(variant_name(name, default_width, jpeg_ext)), srcset(jpeg_ext), sizes, extra,
+    )
@@ -6,8 +6,11 @@ app_name = 'courses'   # обязательно
 urlpatterns = [
     path('', views.index, name='index'),
     path('courses/', views.course_list, name='course_list'),
+    path('api/courses/', views.course_list_api, name='course_list_api'),
     path('course/<int:course_id>/', views.course_detail, name='course_detail'),
     path('course/<int:course_id>/lesson/<int:lesson_id>/', views.lesson_detail, name='lesson_detail'),
+    path('course/<int:course_id>/lesson/<int:lesson_id>/video/', views.lesson_video, name='lesson_video'),
+    path('search/', views.search_view, name='search'),
     path('register/', views.register, name='register'),
     path('login/', views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
@@ -23,4 +26,7 @@ urlpatterns = [
     path('course/<int:course_id>/exam/<int:exam_id>/', views.exam_detail, name='exam_detail'),
     path('course/<int:course_id>/exam/<int:exam_id>/result/<int:attempt_id>/', views.exam_result, name='exam_result'),
 
+    #метрики для Prometheus
+    path('metrics/', views.prometheus_metrics, name='metrics'),
+
 ]
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+Отдача видеофайлов уроков только авторизованным пользователям.
+
+В режиме VIDEO_DELIVERY = 'accel' Django лишь проверяет доступ, а файл
+отдаёт nginx по заголовку X-Accel-Redirect из internal-локации
+VIDEO_ACCEL_PREFIX. В режиме 'python' (разработка, серверы без nginx)
+файл отдаётся потоком по частям с поддержкой Range, ETag и
+Last-Modified, поэтому перемотка в плеере не скачивает файл заново.
+
+Отдача /media/ при DEBUG (serve_media) видео уроков не показывает: они
+доступны только через представление lesson_video.
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views import static
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Каталоги MEDIA_ROOT, файлы из которых отдаются только с проверкой доступа
+PROTECTED_MEDIA_DIRS = ('lessons/videos/',)
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном.
+
+    Возвращает пару (start, end) включительно, None, если заголовок нужно
+    проигнорировать (нет, другой формат, несколько диапазонов), или False,
+    если диапазон лежит за пределами файла.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # bytes=-N: последние N байт
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def range_applies(request, etag, mtime):
+    """If-Range: диапазон действует, только если файл не менялся."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def iter_file(path, start, length, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def stream_file(request, path, content_type):
+    """Отдаёт файл потоком с поддержкой условных запросов и одного диапазона."""
+    stat = os.stat(path)
+    size, etag = stat.st_size, file_etag(stat)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        if not_modified.status_code == 304:
+            not_modified['ETag'] = etag
+            not_modified['Last-Modified'] = http_date(stat.st_mtime)
+        return not_modified
+
+    byte_range = None
+    if range_applies(request, etag, stat.st_mtime):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        iter_file(path, start, length, settings.VIDEO_CHUNK_SIZE),
+        status=206 if byte_range else 200,
+        content_type=content_type,
+    )
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+def accel_redirect(name, content_type):
+    """Передаёт отдачу файла nginx; Range и кэширование он обрабатывает сам."""
+    response = HttpResponse(content_type=content_type)
+    response['X-Accel-Redirect'] = settings.VIDEO_ACCEL_PREFIX + quote(name)
+    return response
+
+
+def video_response(request, field_file):
+    """Ответ с содержимым файла поля FileField в режиме VIDEO_DELIVERY."""
+    content_type = mimetypes.guess_type(field_file.name)[0] or 'application/octet-stream'
+    if settings.VIDEO_DELIVERY == 'accel':
+        response = accel_redirect(field_file.name, content_type)
+    else:
+        response = stream_file(request, field_file.path, content_type)
+    # Браузер может кэшировать видео, общие кэши и прокси - нет
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """django.views.static.serve для /media/, кроме защищённых каталогов."""
+    # Нормализуем так же, как serve, чтобы lessons//videos/ или ./ не обходили проверку
+    normalized = posixpath.normpath(path).lstrip('/').lower() + '/'
+    if normalized.startswith(PROTECTED_MEDIA_DIRS):
+        raise Http404('Файл доступен только через страницу урока')
+    return static.serve(request, path, document_root=document_root, show_indexes=show_indexes)
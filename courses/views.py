@@ -1,55 +1,134 @@
+import hmac
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.views.decorators.http import require_safe
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
 from django.db import transaction
+from geology_education import metrics
+from geology_education.db_pool.pool import published_stats
 from .models import (
-    Course, Lesson, StudentProfile, LessonProgress,
-    Test, TestQuestion, TestChoiceOption, TestAttempt, TestAnswer,
-    Exam, ExamQuestion, ExamChoiceOption, ExamTextAnswer, ExamAttempt, ExamAnswer, RegistrationRequest
+    Course, Lesson, StudentProfile, CourseProgress,
+    Test, TestQuestion, TestAttempt,
+    Exam, ExamQuestion, ExamChoiceOption, ExamTextAnswer, ExamAttempt, RegistrationRequest
 )
+from .async_utils import aget_object_or_404, aget_user, arender
+from .decorators import alogin_required, replica_reads
 from .forms import StudentRegistrationForm
-from django.db.models import Count, Sum, Q
-from django.utils import timezone
-def index(request):
-    courses = Course.objects.all()[:3]
-    return render(request, 'courses/index.html', {'courses': courses})
+from .outline import aget_course_outline
+from .pagination import akeyset_paginate, keyset_paginate, InvalidCursor
+from .page_cache import cache_anonymous_page
+from .progress import lesson_view_buffer, remember_view
+from .search import search
+from .submissions import submit_test, submit_exam
+from .video import video_response
+from django.db.models import Count, Sum, Q, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+# Страницы каталога и уроков только читают данные и выполняются асинхронно
+# (под ASGI запросы к БД не занимают воркер целиком, см. async_utils)
+@replica_reads
+@cache_anonymous_page
+async def index(request):
+    courses = [course async for course in Course.objects.all()[:3]]
+    return await arender(request, 'courses/index.html', {'courses': courses})
 
-def course_list(request):
-    courses = Course.objects.all()
-    return render(request, 'courses/course_list.html', {'courses': courses})
+def catalog_queryset():
+    # Подзапрос вместо JOIN + GROUP BY сохраняет чтение по индексу с LIMIT
+    lessons = Lesson.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    return Course.objects.annotate(
+        lesson_count=Coalesce(Subquery(lessons.annotate(total=Count('pk')).values('total')), 0)
+    )
 
-def course_detail(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
-    lessons = course.lessons.all()
-    return render(request, 'courses/course_detail.html', {
-        'course': course,
-        'lessons': lessons
-    })
+def catalog_page(request, page_size):
+    """Страница каталога по курсору из ?cursor=, вызывает InvalidCursor."""
+    return keyset_paginate(catalog_queryset(), request.GET.get('cursor'), page_size)
 
-@login_required
-def lesson_detail(request, course_id, lesson_id):
-    course = get_object_or_404(Course, id=course_id)
-    lesson = get_object_or_404(Lesson, id=lesson_id, course=course)
 
-    # Получаем предыдущий и следующий уроки по порядку
-    lessons = course.lessons.all().order_by('order_num')
-    lesson_list = list(lessons)
+@replica_reads
+@cache_anonymous_page
+async def course_list(request):
     try:
-        current_index = lesson_list.index(lesson)
-    except ValueError:
-        current_index = -1
+        page = await akeyset_paginate(catalog_queryset(), request.GET.get('cursor'), settings.COURSE_LIST_PAGE_SIZE)
+    except InvalidCursor:
+        raise Http404('Некорректная страница каталога')
+    return await arender(request, 'courses/course_list.html', {
+        'courses': page.items,
+        'next_cursor': page.next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    })
+
 
-    prev_lesson = lesson_list[current_index - 1] if current_index > 0 else None
-    next_lesson = lesson_list[current_index + 1] if current_index < len(lesson_list) - 1 else None
+@replica_reads
+@cache_anonymous_page
+def course_list_api(request):
+    """
+    JSON-список курсов для внутренних панелей: ?cursor=...&limit=...
 
-    return render(request, 'courses/lesson_detail.html', {
+    Ссылки next и url относительные: ответ кэшируется по пути и отдаётся
+    при любом Host и схеме.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', settings.COURSE_LIST_PAGE_SIZE)), 1), 100)
+        page = catalog_page(request, limit)
+    except (ValueError, InvalidCursor):
+        return JsonResponse({'error': 'Некорректные параметры cursor или limit'}, status=400)
+    next_url = None
+    if page.next_cursor:
+        next_url = f"{reverse('courses:course_list_api')}?{urlencode({'cursor': page.next_cursor, 'limit': limit})}"
+    return JsonResponse({
+        'results': [
+            {
+                'id': course.id,
+                'title': course.title,
+                'description': course.description,
+                'image': course.image.url if course.image else None,
+                'lesson_count': course.lesson_count,
+                'created_at': course.created_at.isoformat(),
+                'updated_at': course.updated_at.isoformat(),
+                'url': course.get_absolute_url(),
+            }
+            for course in page.items
+        ],
+        'next_cursor': page.next_cursor,
+        'next': next_url,
+    })
+
+@replica_reads
+@cache_anonymous_page
+async def course_detail(request, course_id):
+    # Курс, уроки, тесты и экзамены (со статусом пользователя) - четыре запроса;
+    # количества в шаблоне берутся из длины уже загруженных списков
+    course = await aget_object_or_404(Course, id=course_id)
+    user = await aget_user(request)
+    lessons = Lesson.objects.filter(course=course).only('id', 'course_id', 'title', 'order_num', 'video_url', 'video_file')
+    return await arender(request, 'courses/course_detail.html', {
         'course': course,
-        'lesson': lesson,
-        'prev_lesson': prev_lesson,
-        'next_lesson': next_lesson
+        'lessons': [lesson async for lesson in lessons],
+        'tests': [test async for test in Test.objects.filter(course=course).with_user_status(user)],
+        'exams': [exam async for exam in Exam.objects.filter(course=course).with_user_status(user)],
+    })
+
+
+@replica_reads
+@login_required
+def search_view(request):
+    """Поиск по курсам, урокам и вопросам: ?q=... (синтаксис websearch)."""
+    query = request.GET.get('q', '').strip()[:200]
+    results = search(query) if query else None
+    return render(request, 'courses/search.html', {
+        'query': query,
+        'results': results,
+        'total': sum(len(items) for items in results.values()) if results else 0,
     })
+
 # Старая функция регистрации
 # def register(request):
 #     if request.method == 'POST':
@@ -149,73 +228,59 @@ def user_logout(request):
     messages.info(request, 'Вы вышли из системы.')
     return redirect('courses:index')   # исправлено
 """Добавил код"""
-@login_required
-def lesson_detail(request, course_id, lesson_id):
-    course = get_object_or_404(Course, id=course_id)
-    lesson = get_object_or_404(Lesson, id=lesson_id, course=course)
-
-    # Отмечаем просмотр урока для авторизованного пользователя
-    if request.user.is_authenticated:
-        LessonProgress.objects.get_or_create(user=request.user, lesson=lesson)
+def record_lesson_view(request, lesson_id):
+    # Отмечаем просмотр урока: уже учтённые в этой сессии пропускаем,
+    # новые записываются в БД пакетно из буфера воркера
+    if remember_view(request, lesson_id):
+        lesson_view_buffer.add(request.user.id, lesson_id)
 
-    # Навигация между уроками (без изменений)
-    lessons = course.lessons.all().order_by('order_num')
-    lesson_list = list(lessons)
-    try:
-        current_index = lesson_list.index(lesson)
-    except ValueError:
-        current_index = -1
+@alogin_required
+async def lesson_detail(request, course_id, lesson_id):
+    lesson = await aget_object_or_404(Lesson.objects.select_related('course'), id=lesson_id, course_id=course_id)
+    course = lesson.course
+    # Сессия и сброс буфера просмотров синхронные
+    await sync_to_async(record_lesson_view)(request, lesson.id)
 
-    prev_lesson = lesson_list[current_index - 1] if current_index > 0 else None
-    next_lesson = lesson_list[current_index + 1] if current_index < len(lesson_list) - 1 else None
+    # Навигация и боковая панель строятся по кэшированному оглавлению курса
+    outline = await aget_course_outline(course)
+    prev_lesson, next_lesson = outline.neighbours(lesson.id)
 
-    return render(request, 'courses/lesson_detail.html', {
+    return await arender(request, 'courses/lesson_detail.html', {
         'course': course,
         'lesson': lesson,
+        'outline': outline,
+        'position': outline.position(lesson.id),
         'prev_lesson': prev_lesson,
         'next_lesson': next_lesson
     })
 
 @login_required
-def my_courses(request):
-    # Получаем все просмотренные уроки пользователя с данными о курсе
-    viewed_lessons = LessonProgress.objects.filter(
-        user=request.user
-    ).select_related('lesson__course').order_by('-viewed_at')
-
-    # Группируем по курсам
-    courses_dict = {}
-    for progress in viewed_lessons:
-        course = progress.lesson.course
-        if course.id not in courses_dict:
-            courses_dict[course.id] = {
-                'course': course,
-                'viewed_count': 0,
-                'total_lessons': course.lessons.count()
-            }
-        courses_dict[course.id]['viewed_count'] += 1
+@require_safe
+def lesson_video(request, course_id, lesson_id):
+    # Доступ к видео тот же, что и к уроку; сам файл из /media/ не отдаётся
+    lesson = get_object_or_404(Lesson.objects.only('id', 'course_id', 'video_file'), id=lesson_id, course_id=course_id)
+    if not lesson.video_file:
+        raise Http404('У урока нет видеофайла')
+    return video_response(request, lesson.video_file)
 
-    # Вычисляем процент для каждого курса
-    courses_list = []
-    for data in courses_dict.values():
-        data['percent'] = int(data['viewed_count'] / data['total_lessons'] * 100) if data['total_lessons'] > 0 else 0
-        courses_list.append(data)
-
-    # Сортируем по дате последнего просмотра (самые свежие сверху)
-    courses_list.sort(key=lambda x: x['course'].id, reverse=True)  # можно улучшить сортировку
+@replica_reads
+@login_required
+def my_courses(request):
+    # Сводный прогресс поддерживается инкрементально (см. progress),
+    # поэтому страница читает одну строку на курс, свежие сверху
+    courses_list = CourseProgress.objects.filter(
+        user=request.user, viewed_count__gt=0
+    ).select_related('course').order_by('-last_viewed_at')
 
     return render(request, 'courses/my_courses.html', {'courses_list': courses_list})
 
 # ----- Тесты -----
+@replica_reads
 @login_required
 def test_list(request, course_id):
     course = get_object_or_404(Course, id=course_id)
-    tests = course.tests.all()
-    # Для каждого теста определяем, пройден ли он текущим пользователем
-    for test in tests:
-        last_attempt = TestAttempt.objects.filter(user=request.user, test=test).order_by('-completed_at').first()
-        test.passed = last_attempt.passed if last_attempt else False
-        test.attempted = last_attempt is not None
+    # Статус прохождения каждого теста считается в том же запросе
+    tests = course.tests.with_user_status(request.user)
     return render(request, 'courses/test_list.html', {'course': course, 'tests': tests})
 
 @login_required
@@ -223,31 +288,9 @@ def test_detail(request, course_id, test_id):
     course = get_object_or_404(Course, id=course_id)
     test = get_object_or_404(Test, id=test_id, course=course)
 
-    # Проверяем, есть ли уже пройденная попытка
-    existing_attempt = TestAttempt.objects.filter(user=request.user, test=test, completed_at__isnull=False).first()
-    if existing_attempt and not test.allow_retake:  # Если пересдача не разрешена
-        return redirect('courses:test_result', course_id=course.id, test_id=test.id, attempt_id=existing_attempt.id)
-
     if request.method == 'POST':
-        # Создаём попытку
-        attempt = TestAttempt.objects.create(user=request.user, test=test)
-        score = 0
-        total_points = test.total_points()
-        for question in test.questions.all():
-            selected = request.POST.getlist(f'question_{question.id}')
-            # Сохраняем ответ
-            answer = TestAnswer.objects.create(attempt=attempt, question=question)
-            if selected:
-                options = TestChoiceOption.objects.filter(id__in=selected)
-                answer.selected_options.set(options)
-            # Подсчёт баллов
-            if answer.is_correct():
-                score += question.points
-        # Обновляем попытку
-        attempt.score = score
-        attempt.passed = (score / total_points * 100) >= test.passing_score if total_points else False
-        attempt.completed_at = timezone.now()
-        attempt.save()
+        # Проверка и запись ответов выполняются пакетно, см. submissions.submit_test
+        attempt = submit_test(request.user, test, request.POST)
         return redirect('courses:test_result', course_id=course.id, test_id=test.id, attempt_id=attempt.id)
 
     # GET запрос — показываем форму
@@ -258,15 +301,19 @@ def test_detail(request, course_id, test_id):
         'questions': questions
     })
 
-@login_required
-def test_result(request, course_id, test_id, attempt_id):
-    course = get_object_or_404(Course, id=course_id)
-    test = get_object_or_404(Test, id=test_id, course=course)
-    attempt = get_object_or_404(TestAttempt, id=attempt_id, user=request.user, test=test)
+@replica_reads
+@alogin_required
+async def test_result(request, course_id, test_id, attempt_id):
+    # Попытка вместе с тестом и курсом - один запрос
+    attempt = await aget_object_or_404(
+        TestAttempt.objects.select_related('test__course'),
+        id=attempt_id, user=request.user, test_id=test_id, test__course_id=course_id,
+    )
+    test = attempt.test
     total_points = test.total_points()
     percent = int(attempt.score / total_points * 100) if total_points else 0
-    return render(request, 'courses/test_result.html', {
-        'course': course,
+    return await arender(request, 'courses/test_result.html', {
+        'course': test.course,
         'test': test,
         'attempt': attempt,
         'total_points': total_points,
@@ -274,14 +321,11 @@ def test_result(request, course_id, test_id, attempt_id):
     })
 
 # ----- Экзамены -----
+@replica_reads
 @login_required
 def exam_list(request, course_id):
     course = get_object_or_404(Course, id=course_id)
-    exams = course.exams.all()
-    for exam in exams:
-        last_attempt = ExamAttempt.objects.filter(user=request.user, exam=exam).order_by('-completed_at').first()
-        exam.passed = last_attempt.passed if last_attempt else False
-        exam.attempted = last_attempt is not None
+    exams = course.exams.with_user_status(request.user)
     return render(request, 'courses/exam_list.html', {'course': course, 'exams': exams})
 
 @login_required
@@ -295,25 +339,7 @@ def exam_detail(request, course_id, exam_id):
         return redirect('courses:exam_result', course_id=course.id, exam_id=exam.id, attempt_id=existing_attempt.id)
 
     if request.method == 'POST':
-        attempt = ExamAttempt.objects.create(user=request.user, exam=exam)
-        score = 0
-        total_points = exam.total_points()
-        for question in exam.questions.all():
-            answer = ExamAnswer.objects.create(attempt=attempt, question=question)
-            if question.type == 'choice':
-                selected = request.POST.getlist(f'question_{question.id}')
-                if selected:
-                    options = ExamChoiceOption.objects.filter(id__in=selected)
-                    answer.selected_options.set(options)
-            else:  # text
-                text_answer = request.POST.get(f'question_{question.id}', '').strip()
-                answer.text_answer = text_answer
-                answer.save()
-            score += answer.points_earned()
-        attempt.score = score
-        attempt.passed = (score / total_points * 100) >= exam.passing_score if total_points else False
-        attempt.completed_at = timezone.now()
-        attempt.save()
+        attempt = submit_exam(request.user, exam, request.POST)
         return redirect('courses:exam_result', course_id=course.id, exam_id=exam.id, attempt_id=attempt.id)
 
     questions = exam.questions.all().prefetch_related('options', 'text_answers')
@@ -323,17 +349,39 @@ def exam_detail(request, course_id, exam_id):
         'questions': questions
     })
 
-@login_required
-def exam_result(request, course_id, exam_id, attempt_id):
-    course = get_object_or_404(Course, id=course_id)
-    exam = get_object_or_404(Exam, id=exam_id, course=course)
-    attempt = get_object_or_404(ExamAttempt, id=attempt_id, user=request.user, exam=exam)
+@replica_reads
+@alogin_required
+async def exam_result(request, course_id, exam_id, attempt_id):
+    attempt = await aget_object_or_404(
+        ExamAttempt.objects.select_related('exam__course'),
+        id=attempt_id, user=request.user, exam_id=exam_id, exam__course_id=course_id,
+    )
+    exam = attempt.exam
     total_points = exam.total_points()
     percent = int(attempt.score / total_points * 100) if total_points else 0
-    return render(request, 'courses/exam_result.html', {
-        'course': course,
+    return await arender(request, 'courses/exam_result.html', {
+        'course': exam.course,
         'exam': exam,
         'attempt': attempt,
         'total_points': total_points,
         'percent': percent
-    })
\ No newline at end of file
+    })
+
+# ----- Метрики -----
+def _metrics_allowed(request):
+    # Сотрудник (сессия) или сборщик Prometheus с заголовком Authorization: Bearer METRICS_TOKEN
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    if token and header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], token):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+@require_safe
+def prometheus_metrics(request):
+    """Метрики запросов всех воркеров и пулов соединений в текстовом формате Prometheus."""
+    if not _metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.render_prometheus(metrics.collect(), published_stats()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -9,5 +9,8 @@ python manage.py collectstatic --noinput
 # Создаём суперпользователя (если не существует)
 python manage.py shell -c "from django.contrib.auth.models import User; User.objects.filter(username='admin').exists() or User.objects.create_superuser('admin', 'admin@example.com', 'admin')"
 
-# Запускаем Gunicorn
+# Запускаем Gunicorn (GUNICORN_PROFILE=asgi - воркеры uvicorn, см. gunicorn.conf.py)
+if [ "$GUNICORN_PROFILE" = "asgi" ]; then
+    exec gunicorn geology_education.asgi:application -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000 --workers 3
+fi
 exec gunicorn geology_education.wsgi:application --bind 0.0.0.0:8000 --workers 3
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Сайт админки проекта.
+
+Стандартный AdminSite со страницами профилей запросов (см.
+geology_education.profiling) в собственных URL админки: admin:profiles,
+admin:profile и admin:profile_download. Подключается как сайт по
+умолчанию через geology_education.apps.AdminConfig.
+"""
+
+from django.conf import settings
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from geology_education import profiling
+
+
+class AdminSite(admin.AdminSite):
+    index_template = 'admin/courses_index.html'
+
+    def get_urls(self):
+        return [
+            path('profiles/', self.admin_view(self.profile_list_view), name='profiles'),
+            path('profiles/<str:profile_id>/', self.admin_view(self.profile_detail_view), name='profile'),
+            path(
+                'profiles/<str:profile_id>/download/',
+                self.admin_view(self.profile_download_view),
+                name='profile_download',
+            ),
+        ] + super().get_urls()
+
+    def profile_list_view(self, request):
+        store = profiling.ProfileStore()
+        return TemplateResponse(request, 'admin/profiles/list.html', {
+            **self.each_context(request),
+            'title': 'Профили запросов',
+            'profiles': store.list(),
+            'keep': store.keep,
+            'param': profiling.PROFILE_PARAM,
+            'token': profiling.make_token(request.user),
+            'token_minutes': settings.PROFILE_TOKEN_MAX_AGE // 60,
+        })
+
+    def profile_detail_view(self, request, profile_id):
+        profile = profiling.ProfileStore().get(profile_id)
+        if profile is None:
+            raise Http404('Профиль не найден или уже удалён')
+        return TemplateResponse(request, 'admin/profiles/detail.html', {
+            **self.each_context(request),
+            'title': f'Профиль {profile["method"]} {profile["path"]}',
+            'profile': profile,
+        })
+
+    def profile_download_view(self, request, profile_id):
+        store = profiling.ProfileStore()
+        if store.get(profile_id) is None:
+            raise Http404('Профиль не найден или уже удалён')
+        return FileResponse(open(store.path(profile_id, '.prof'), 'rb'), as_attachment=True, filename=f'{profile_id}.prof')
@@ -0,0 +1,7 @@
+from django.contrib.admin.apps import AdminConfig as BaseAdminConfig
+
+
+class AdminConfig(BaseAdminConfig):
+    """django.contrib.admin с сайтом проекта (страницы профилей запросов)."""
+
+    default_site = 'geology_education.admin.AdminSite'
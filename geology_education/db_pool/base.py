@@ -0,0 +1,48 @@
+"""
+Бэкенд PostgreSQL с пулом соединений.
+
+ENGINE = 'geology_education.db_pool', параметры пула задаются в
+OPTIONS['pool'] (max_size, timeout, max_idle, см. pool.ConnectionPool).
+Соединение берётся из пула при первом обращении к БД и возвращается в
+него, когда Django его закрывает - в конце запроса при CONN_MAX_AGE = 0.
+Так каждый запрос обходится без установки соединения и аутентификации.
+"""
+
+from functools import partial
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.backends.postgresql import base
+
+from .creation import DatabaseCreation
+from .pool import get_pool, publish_stats
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    pool = None
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        # Отдельный пул для каждого набора параметров: тестовая БД и
+        # служебная БД postgres не смешиваются с рабочей
+        key = (self.alias, repr(sorted(conn_params.items())))
+        self.pool = get_pool(key, **self.settings_dict['OPTIONS'].get('pool', {}))
+        return self.pool.acquire(partial(super().get_new_connection, conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
+
+
+def publish_pool_stats(**kwargs):
+    publish_stats(settings.DB_POOL_STATS_INTERVAL)
+
+
+request_finished.connect(publish_pool_stats, dispatch_uid='db_pool_publish_stats')
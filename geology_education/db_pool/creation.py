@@ -0,0 +1,16 @@
+from django.db.backends.postgresql import creation
+
+from .pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Свободные соединения пула к тестовой БД не дают её удалить
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        # CREATE DATABASE ... TEMPLATE требует, чтобы к шаблону никто не был подключён
+        close_pools()
+        super()._clone_test_db(suffix, verbosity, keepdb)
@@ -0,0 +1,220 @@
+"""
+Пул соединений с PostgreSQL внутри процесса воркера.
+
+Пул общий для всех потоков процесса (gthread, ASGI) и ограничен
+max_size соединениями. Когда все соединения заняты, запрос ждёт
+освобождения не дольше timeout секунд. Перед выдачей соединение
+проверяется запросом SELECT 1, соединения без дела дольше max_idle
+секунд закрываются.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+from geology_education import worker_stats
+
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('checkouts', 'waits', 'timeouts', 'created', 'discarded')
+STATS_NAME = 'db_pool:stats'
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Все соединения пула заняты дольше timeout секунд."""
+
+
+class ConnectionPool:
+
+    def __init__(self, max_size=20, timeout=10, max_idle=300):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.pid = os.getpid()
+        self._idle = deque()  # (соединение, время возврата), последнее возвращённое справа
+        self._size = 0  # открытые соединения, включая создаваемые
+        self._cond = threading.Condition()
+        self._counters = dict.fromkeys(COUNTERS, 0)
+
+    def acquire(self, connect):
+        """
+        Выдаёт соединение из пула или открывает новое вызовом connect().
+
+        Если пул заполнен, ждёт возврата соединения; по истечении timeout
+        выбрасывает PoolTimeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    if not waited:
+                        waited = True
+                        self._counters['waits'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        logger.warning('Пул соединений: все %d соединений заняты дольше %s с', self.max_size, self.timeout)
+                        raise PoolTimeout(f'Нет свободных соединений в пуле (max_size={self.max_size})')
+                    self._cond.wait(remaining)
+                self._counters['checkouts'] += 1
+                if self._idle:
+                    connection, _ = self._idle.pop()
+                else:
+                    connection = None
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self._forget()
+                    raise
+                with self._cond:
+                    self._counters['created'] += 1
+                return connection
+
+            if self._is_healthy(connection):
+                return connection
+            # Соединение разорвано сервером или сетью: закрываем и берём следующее
+            self._close_quietly(connection)
+            self._forget(discarded=True)
+
+    def release(self, connection):
+        """Возвращает соединение в пул, откатив незавершённую транзакцию."""
+        reusable = self._reset(connection) and os.getpid() == self.pid
+        with self._cond:
+            if reusable:
+                self._idle.append((connection, time.monotonic()))
+            expired = self._pop_expired()
+            self._size -= len(expired)
+            self._cond.notify()
+        if not reusable:
+            self._close_quietly(connection)
+            self._forget(discarded=True)
+        for connection in expired:
+            self._close_quietly(connection)
+
+    def close_idle(self):
+        """Закрывает все свободные соединения (остановка воркера, удаление тестовой БД)."""
+        with self._cond:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._size - len(self._idle),
+                'idle': len(self._idle),
+                **self._counters,
+            }
+
+    def _forget(self, discarded=False):
+        with self._cond:
+            self._size -= 1
+            if discarded:
+                self._counters['discarded'] += 1
+            self._cond.notify()
+
+    def _pop_expired(self):
+        expired = []
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    @staticmethod
+    def _is_healthy(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    @staticmethod
+    def _reset(connection):
+        if connection.closed:
+            return False
+        status = connection.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+_pools = {}
+_inherited = []
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, **options):
+    """
+    Пул процесса для набора параметров подключения key.
+
+    Пулы, унаследованные от родителя при fork, не используются и не
+    закрываются: их сокеты принадлежат родительскому процессу.
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            if pool is not None:
+                _inherited.append(pool)
+            pool = _pools[key] = ConnectionPool(**options)
+        return pool
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        if pool.pid == os.getpid():
+            pool.close_idle()
+
+
+def pool_stats():
+    """Суммарные счётчики пулов текущего процесса."""
+    totals = {}
+    for pool in list(_pools.values()):
+        if pool.pid == os.getpid():
+            for name, value in pool.stats().items():
+                totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def publish_stats(interval):
+    """
+    Раз в interval секунд сохраняет счётчики процесса в общий кэш,
+    чтобы команда db_pool_stats показала их по всем воркерам.
+    """
+    worker_stats.publish(STATS_NAME, pool_stats, interval)
+
+
+def published_stats():
+    """Последние опубликованные счётчики работающих воркеров: {воркер: счётчики}."""
+    return worker_stats.collect(STATS_NAME)
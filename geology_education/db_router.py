@@ -0,0 +1,70 @@
+"""
+Чтение с реплики для страниц, которые только читают данные.
+
+Реплика используется только внутри запроса к представлению, помеченному
+декоратором courses.decorators.replica_reads (и к спискам объектов в
+админке), см. courses.middleware.replica_routing_middleware. Запись всегда
+идёт в основную БД. После записи ответ ставит cookie, и следующие
+REPLICA_STICKY_SECONDS секунд все чтения этого пользователя тоже идут в
+основную БД - студент сразу видит свой результат, даже если реплика
+отстаёт. Вне HTTP-запросов (команды, фоновые задачи) реплика не
+используется.
+"""
+
+import contextvars
+import random
+
+from django.conf import settings
+
+
+class RequestRouting:
+    """Состояние маршрутизации одного запроса; общее для всех потоков запроса."""
+
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+def begin_request(replica):
+    """Начинает маршрутизацию запроса; возвращает токен для end_request."""
+    return _routing.set(RequestRouting(replica))
+
+
+def use_primary():
+    """Переводит чтения текущего запроса до его конца в основную БД."""
+    routing = _routing.get()
+    if routing is not None:
+        routing.replica = False
+
+
+def end_request(token):
+    """Завершает маршрутизацию; возвращает признак записи в БД за время запроса."""
+    routing = _routing.get()
+    _routing.reset(token)
+    return routing.wrote
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None and routing.replica and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            # До конца запроса читаем то, что записали, из основной БД
+            routing.replica = False
+            routing.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На реплике те же данные, что и в основной БД
+        return True
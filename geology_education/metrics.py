@@ -0,0 +1,256 @@
+"""
+Метрики производительности запросов.
+
+Для каждого запроса courses.middleware.performance_middleware собирает
+число SQL-запросов и время в БД (обёртка курсора, устанавливается на
+каждое новое соединение), время рендеринга шаблонов (бэкенд шаблонов
+DjangoTemplates из этого модуля) и общее время. Значения попадают в
+гистограммы по имени маршрута в памяти воркера; раз в
+METRICS_PUBLISH_INTERVAL секунд воркер сохраняет снимок в общий кэш
+(см. worker_stats), и эндпоинт метрик отдаёт снимки всех воркеров в
+текстовом формате Prometheus с меткой worker. Счётчики воркеров не
+суммируются: набор воркеров меняется (перезапуск, простой дольше срока
+хранения снимка), и сумма уменьшалась бы, что Prometheus принял бы за
+сброс. Общие значения даёт запрос вида sum without (worker) (...).
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.template.backends import django as django_backend
+
+from geology_education import worker_stats
+
+
+slow_logger = logging.getLogger('geology_education.slow_requests')
+
+STATS_NAME = 'metrics'
+PREFIX = 'geology'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Имя гистограммы: (описание, границы корзин)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Время обработки запроса', DURATION_BUCKETS),
+    'http_request_db_seconds': ('Время SQL-запросов за запрос', DURATION_BUCKETS),
+    'http_request_template_seconds': ('Время рендеринга шаблонов за запрос', DURATION_BUCKETS),
+    'http_request_queries': ('Число SQL-запросов за запрос', QUERY_BUCKETS),
+}
+
+# Сколько запросов с SQL запоминать для журнала медленных запросов
+MAX_RECORDED_QUERIES = 100
+
+
+class RequestMetrics:
+    """Замеры одного запроса; общие для всех потоков запроса."""
+
+    __slots__ = ('queries', 'db_seconds', 'template_seconds', 'sql', '_template_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.sql = []  # (время, SQL) первых MAX_RECORDED_QUERIES запросов
+        self._template_depth = 0
+
+    def server_timing(self, total):
+        """Значение заголовка Server-Timing."""
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} SQL", '
+            f'tpl;dur={self.template_seconds * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def begin_request():
+    """
+    Начинает замеры запроса; возвращает токен для end_request. Внутри уже
+    начатых замеров (courses.benchmarks вокруг тестового клиента)
+    продолжает их.
+    """
+    return _current.set(_current.get() or RequestMetrics())
+
+
+def end_request(token):
+    """Завершает замеры; возвращает RequestMetrics запроса."""
+    metrics = _current.get()
+    _current.reset(token)
+    return metrics
+
+
+def current_request():
+    """Замеры текущего запроса или None вне performance_middleware."""
+    return _current.get()
+
+
+def query_timer(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.db_seconds += elapsed
+        if len(metrics.sql) < MAX_RECORDED_QUERIES:
+            # Без параметров: в журнал не попадают пароли и персональные данные
+            metrics.sql.append((elapsed, sql))
+
+
+def install_query_timer(connection):
+    """Подключает замер SQL к соединению (обработчик connection_created)."""
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_timer)
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        metrics._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics._template_depth -= 1
+            if not metrics._template_depth:
+                metrics.template_seconds += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Бэкенд шаблонов Django, учитывающий время рендеринга в метриках запроса."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return Template(template.template, self)
+
+
+def log_slow_request(request, view, total, metrics):
+    """Записывает медленный запрос вместе с его SQL, самые долгие запросы первыми."""
+    lines = [
+        f'{request.method} {request.get_full_path()} ({view}): {total * 1000:.0f} мс, '
+        f'SQL {metrics.queries} за {metrics.db_seconds * 1000:.0f} мс, '
+        f'шаблоны {metrics.template_seconds * 1000:.0f} мс'
+    ]
+    for elapsed, sql in sorted(metrics.sql, key=lambda item: item[0], reverse=True):
+        lines.append(f'  {elapsed * 1000:8.1f} мс  {sql}')
+    if metrics.queries > len(metrics.sql):
+        lines.append(f'  ... ещё {metrics.queries - len(metrics.sql)} запросов')
+    slow_logger.warning('\n'.join(lines))
+
+
+class MetricsRegistry:
+    """Счётчики запросов и гистограммы по маршрутам в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = Counter()  # (маршрут, метод, код ответа) -> запросов
+        self._histograms = {}  # (гистограмма, маршрут) -> [корзины..., +Inf, сумма]
+
+    def observe(self, view, method, status, total, metrics):
+        values = {
+            'http_request_duration_seconds': total,
+            'http_request_db_seconds': metrics.db_seconds,
+            'http_request_template_seconds': metrics.template_seconds,
+            'http_request_queries': metrics.queries,
+        }
+        with self._lock:
+            self._requests[view, method, status] += 1
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                histogram = self._histograms.get((name, view))
+                if histogram is None:
+                    histogram = self._histograms[name, view] = [0] * (len(buckets) + 1) + [0]
+                histogram[bisect_left(buckets, value)] += 1
+                histogram[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': dict(self._requests),
+                'histograms': {key: list(value) for key, value in self._histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+def publish(interval):
+    worker_stats.publish(STATS_NAME, registry.snapshot, interval)
+
+
+def collect():
+    """Снимки всех воркеров, для текущего процесса - актуальные счётчики."""
+    snapshots = worker_stats.collect(STATS_NAME)
+    snapshots[worker_stats.worker_name()] = registry.snapshot()
+    return snapshots
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render_prometheus(snapshots, pool_stats=None):
+    """
+    Текстовый формат Prometheus по снимкам воркеров {воркер: снимок}:
+    счётчик запросов, гистограммы по маршрутам и, если переданы, счётчики
+    пулов соединений по воркерам.
+    """
+    workers = sorted(snapshots.items())
+    lines = [
+        f'# HELP {PREFIX}_http_requests_total Обработано запросов',
+        f'# TYPE {PREFIX}_http_requests_total counter',
+    ]
+    for worker, snapshot in workers:
+        for (view, method, status), count in sorted(snapshot['requests'].items()):
+            labels = _labels(view=view, method=method, status=status, worker=worker)
+            lines.append(f'{PREFIX}_http_requests_total{labels} {count}')
+
+    for name, (description, buckets) in HISTOGRAMS.items():
+        metric = f'{PREFIX}_{name}'
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} histogram']
+        for worker, snapshot in workers:
+            for (histogram_name, view), values in sorted(snapshot['histograms'].items()):
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{_labels(view=view, worker=worker, le=bound)} {cumulative}')
+                lines.append(f'{metric}_sum{_labels(view=view, worker=worker)} {values[-1]:.6g}')
+                lines.append(f'{metric}_count{_labels(view=view, worker=worker)} {cumulative}')
+
+    if pool_stats:
+        gauges = (('in_use', 'Занятые соединения пула'), ('idle', 'Свободные соединения пула'))
+        counters = (('waits', 'Ожидания свободного соединения'), ('timeouts', 'Отказы по таймауту пула'))
+        for field, description in gauges:
+            metric = f'{PREFIX}_db_pool_{field}'
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} gauge']
+            lines += [f'{metric}{_labels(worker=worker)} {stats.get(field, 0)}' for worker, stats in sorted(pool_stats.items())]
+        for field, description in counters:
+            metric = f'{PREFIX}_db_pool_{field}_total'
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} counter']
+            lines += [f'{metric}{_labels(worker=worker)} {stats.get(field, 0)}' for worker, stats in sorted(pool_stats.items())]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,165 @@
+"""
+Профилирование отдельных запросов по требованию сотрудника.
+
+Сотрудник получает на странице «Профили запросов» в админке подписанный
+токен и добавляет его к любому URL параметром ?_profile=<токен> или
+заголовком X-Profile: <токен>. Такой запрос courses.middleware.
+profiling_middleware выполняет под cProfile: профиль охватывает
+представление и рендеринг шаблонов. Результат - самые долгие функции по
+суммарному времени и SQL запроса (из geology_education.metrics) -
+сохраняется в каталог PROFILE_DIR, где хранятся последние PROFILE_KEEP
+профилей; там же лежит .prof для snakeviz или pstats.
+
+Остальные запросы только проверяют, нет ли в них параметра или заголовка.
+cProfile видит один поток: под ASGI в профиль попадает код в цикле
+событий, но не синхронные части, выполняемые в других потоках.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+
+TOKEN_SALT = 'geology_education.profiling'
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+# Сколько функций с наибольшим суммарным временем сохранять в профиле
+TOP_FUNCTIONS = 40
+
+PROFILE_ID_RE = re.compile(r'^\d+-\d+$')
+
+
+def make_token(user):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def token_user_id(token):
+    """Идентификатор сотрудника из токена; None, если подпись неверна или истекла."""
+    try:
+        return int(signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILE_TOKEN_MAX_AGE))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def requested_token(request):
+    """Токен из запроса или None; для обычных запросов - две проверки вхождения."""
+    if PROFILE_HEADER in request.META:
+        return request.META[PROFILE_HEADER]
+    if PROFILE_PARAM + '=' in request.META.get('QUERY_STRING', ''):
+        return request.GET.get(PROFILE_PARAM)
+    return None
+
+
+def top_functions(profiler, limit=TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            'function': function,
+            'file': filename,
+            'line': line,
+            'calls': calls,
+            'tottime_ms': tottime * 1000,
+            'cumtime_ms': cumtime * 1000,
+        }
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in rows
+    ]
+
+
+class ProfileStore:
+    """
+    Кольцо последних профилей на диске: <id>.json с результатом и <id>.prof
+    со статистикой cProfile. Идентификатор - время создания в наносекундах
+    и pid воркера, поэтому профили сортируются по времени.
+    """
+
+    def __init__(self, directory=None, keep=None):
+        self.directory = Path(directory or settings.PROFILE_DIR)
+        self.keep = keep or settings.PROFILE_KEEP
+
+    def save(self, profile, profiler):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f'{time.time_ns()}-{os.getpid()}'
+        profile = {'id': profile_id, **profile}
+        profiler.dump_stats(self.path(profile_id, '.prof'))
+        # Сначала во временный файл: список не увидит недописанный профиль
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, suffix='.tmp', delete=False, encoding='utf-8') as output:
+            json.dump(profile, output, ensure_ascii=False)
+        os.replace(output.name, self.path(profile_id, '.json'))
+        self.trim()
+        return profile_id
+
+    def trim(self):
+        for profile_id in self.ids()[self.keep:]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(self.path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def ids(self):
+        """Идентификаторы профилей, новые первыми."""
+        if not self.directory.is_dir():
+            return []
+        ids = [path.stem for path in self.directory.glob('*.json') if PROFILE_ID_RE.match(path.stem)]
+        return sorted(ids, key=lambda profile_id: int(profile_id.split('-')[0]), reverse=True)
+
+    def get(self, profile_id):
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        try:
+            with open(self.path(profile_id, '.json'), encoding='utf-8') as source:
+                return json.load(source)
+        except FileNotFoundError:
+            return None
+
+    def list(self):
+        return [profile for profile in map(self.get, self.ids()) if profile is not None]
+
+    def path(self, profile_id, suffix):
+        return self.directory / f'{profile_id}{suffix}'
+
+
+def describe(request, response, profiler, duration, request_metrics):
+    """Результат профилирования запроса для сохранения в ProfileStore."""
+    match = request.resolver_match
+    profile = {
+        'created_at': timezone.localtime().isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'view': match.view_name if match else '',
+        'status': response.status_code,
+        'duration_ms': duration * 1000,
+        'queries': 0,
+        'db_ms': 0,
+        'sql': [],
+        'functions': top_functions(profiler),
+    }
+    if request_metrics is not None:
+        profile.update(
+            queries=request_metrics.queries,
+            db_ms=request_metrics.db_seconds * 1000,
+            sql=[(elapsed * 1000, sql) for elapsed, sql in request_metrics.sql],
+        )
+    return profile
+
+
+def profile_call(func, *args):
+    """Выполняет func(*args) под cProfile; возвращает (результат, профилировщик, время)."""
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        result = func(*args)
+    finally:
+        profiler.disable()
+    return result, profiler, time.perf_counter() - started
@@ -15,17 +15,28 @@ ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS', 'localhost,127.0.0.1').split('
 
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'geology_education.apps.AdminConfig',  # django.contrib.admin с сайтом проекта
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'courses.apps.CoursesConfig',
 ]
 
 MIDDLEWARE =  [
+    # Server-Timing, гистограммы по маршрутам (/metrics/) и журнал медленных запросов
+    'courses.middleware.performance_middleware',
+    # Профилирование запроса по токену сотрудника (?_profile=... или X-Profile), см. «Профили запросов» в админке
+    'courses.middleware.profiling_middleware',
+    # Под ASGI: очередь запросов сверх ASGI_MAX_CONCURRENT_REQUESTS (соединения с БД)
+    'courses.middleware.concurrency_limit_middleware',
     'django.middleware.security.SecurityMiddleware',
+    # Статика без nginx (Docker): сжатые .gz/.br копии и immutable-заголовки для хэшированных имён
+    'courses.middleware.StaticFilesMiddleware',
+    # Чтение страниц с пометкой replica_reads - с реплики (до сессий: их запись тоже учитывается)
+    'courses.middleware.replica_routing_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -38,7 +49,8 @@ ROOT_URLCONF = 'geology_education.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Обычный бэкенд Django с замером времени рендеринга для метрик запросов
+        'BACKEND': 'geology_education.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -56,16 +68,116 @@ TEMPLATES = [
 WSGI_APPLICATION = 'geology_education.wsgi.application'
 
 # База данных PostgreSQL
+# PostgreSQL с пулом соединений в каждом воркере (geology_education/db_pool).
+# Воркер держит не больше DB_POOL_SIZE соединений: синхронному воркеру хватает
+# одного, gthread - по одному на поток, ASGI - ASGI_MAX_CONCURRENT_REQUESTS.
+# Воркеры * DB_POOL_SIZE не должно превышать max_connections PostgreSQL.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'geology_education.db_pool',
         'NAME': os.getenv('DB_NAME', 'geology_db'),
         'USER': os.getenv('DB_USER', 'postgres'),
         'PASSWORD': os.getenv('DB_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        'OPTIONS': {
+            'pool': {
+                'max_size': int(os.getenv('DB_POOL_SIZE', '20')),
+                # Сколько секунд ждать свободного соединения
+                'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+                # Через сколько секунд без дела соединение закрывается
+                'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+            },
+        },
+    }
+}
+
+# Реплика только для чтения (потоковая репликация PostgreSQL). Включается
+# переменными DB_REPLICA_HOST и/или DB_REPLICA_NAME; без них всё читается из
+# основной БД. Для проверки на одной машине подойдёт вторая локальная база:
+# createdb -T geology_db geology_replica, DB_REPLICA_NAME=geology_replica.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+    'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+    'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+    'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+    'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    # В тестах реплика - та же тестовая база
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_REPLICAS = ['replica'] if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME') else []
+DATABASE_ROUTERS = ['geology_education.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает только из основной БД
+# (должно превышать обычное отставание реплики)
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '15'))
+
+# Как часто воркер публикует счётчики пула в кэш (python manage.py db_pool_stats)
+DB_POOL_STATS_INTERVAL = int(os.getenv('DB_POOL_STATS_INTERVAL', '10'))
+
+# Метрики запросов: как часто воркер публикует гистограммы в общий кэш (секунд),
+# токен сборщика Prometheus для /metrics/ (кроме него доступ только у сотрудников)
+# и порог журнала медленных запросов с их SQL (секунд)
+METRICS_PUBLISH_INTERVAL = int(os.getenv('METRICS_PUBLISH_INTERVAL', '10'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '1.0'))
+
+# Профили запросов: каталог, сколько последних профилей хранить и срок действия токена (секунд)
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+PROFILE_TOKEN_MAX_AGE = int(os.getenv('PROFILE_TOKEN_MAX_AGE', '3600'))
+
+# Журнал медленных запросов пишется в SLOW_REQUEST_LOG или, если путь не задан, в stderr
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_requests': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': os.getenv('SLOW_REQUEST_LOG'),
+        } if os.getenv('SLOW_REQUEST_LOG') else {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'geology_education.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Общий для всех воркеров кэш: роли пользователей, кэш страниц с блокировками
+# пересборки, счётчики воркеров. Кэш страниц и метрики рассчитывают на атомарные
+# add и incr, поэтому в продакшене нужен Redis (REDIS_URL, пакет redis).
+# Без него используется файловый кэш - только для одного сервера: add и incr в нём
+# не атомарны между процессами (страницу могут пересобрать два воркера, приращения
+# счётчиков иногда теряются), а каждая запись перечисляет все файлы кэша. Чистка при
+# MAX_ENTRIES удаляет случайную треть записей, поэтому предел поднят намного выше
+# числа ключей (по ключу ролей на каждого пользователя).
+REDIS_URL = os.getenv('REDIS_URL', '')
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    'django.core.cache.backends.redis.RedisCache' if REDIS_URL else 'django.core.cache.backends.filebased.FileBasedCache',
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', REDIS_URL or str(BASE_DIR / 'cache')),
     }
 }
+if CACHE_BACKEND.endswith(('FileBasedCache', 'LocMemCache')):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '1000000'))}
+
+# Сколько секунд хранить роли пользователя в кэше (инвалидация - по сигналам)
+ROLE_CACHE_TIMEOUT = int(os.getenv('ROLE_CACHE_TIMEOUT', '3600'))
+
+# Кэш страниц каталога для анонимных пользователей (секунды):
+# срок свежести копии, срок хранения устаревшей копии и блокировка пересборки
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', '600'))
+PAGE_CACHE_STALE_TIMEOUT = int(os.getenv('PAGE_CACHE_STALE_TIMEOUT', '86400'))
+PAGE_CACHE_LOCK_TIMEOUT = int(os.getenv('PAGE_CACHE_LOCK_TIMEOUT', '30'))
 
 # Валидация паролей (можно оставить как есть)
 
@@ -78,11 +190,67 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic добавляет к именам хэш содержимого (style.3f2a9c1b4d5e.css)
+# и рядом сохраняет сжатые копии .gz и .br (brotli при установленном пакете Brotli)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'geology_education.storage.StaticFilesStorage'},
+}
+# Без манифеста (тесты, collectstatic ещё не запускался) отдаём исходные имена
+WHITENOISE_MANIFEST_STRICT = False
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Сколько скомпилированных ключей ответов держать в памяти одного воркера
+ANSWER_KEY_CACHE_SIZE = int(os.getenv('ANSWER_KEY_CACHE_SIZE', '256'))
+# Сколько оглавлений курсов держать в памяти одного воркера
+COURSE_OUTLINE_CACHE_SIZE = int(os.getenv('COURSE_OUTLINE_CACHE_SIZE', '512'))
+
+# Отложенная запись просмотров уроков: размер пакета и интервал сброса (секунд, 0 - только по размеру)
+LESSON_PROGRESS_FLUSH_BATCH_SIZE = int(os.getenv('LESSON_PROGRESS_FLUSH_BATCH_SIZE', '200'))
+LESSON_PROGRESS_FLUSH_INTERVAL = float(os.getenv('LESSON_PROGRESS_FLUSH_INTERVAL', '5'))
+
+# Заявки на регистрацию: выборки больше REGISTRATION_BULK_SYNC_LIMIT рассматриваются
+# фоновым заданием пакетами по REGISTRATION_JOB_BATCH_SIZE; задание без прогресса дольше
+# REGISTRATION_JOB_STALE_SECONDS секунд продолжает команда run_registration_jobs
+REGISTRATION_BULK_SYNC_LIMIT = int(os.getenv('REGISTRATION_BULK_SYNC_LIMIT', '2000'))
+REGISTRATION_JOB_BATCH_SIZE = int(os.getenv('REGISTRATION_JOB_BATCH_SIZE', '1000'))
+REGISTRATION_JOB_STALE_SECONDS = int(os.getenv('REGISTRATION_JOB_STALE_SECONDS', '300'))
+
+# Импорт студентов: процессов для хэширования паролей (0 - по числу ядер) и размер
+# пакета bulk_create; загрузка в админке хэширует пароли в запросе, поэтому строк в ней
+# не больше STUDENT_IMPORT_ADMIN_MAX_ROWS (~140 мс PBKDF2 на строку и ядро, таймаут gunicorn 30 с)
+STUDENT_IMPORT_WORKERS = int(os.getenv('STUDENT_IMPORT_WORKERS', '0'))
+STUDENT_IMPORT_BATCH_SIZE = int(os.getenv('STUDENT_IMPORT_BATCH_SIZE', '1000'))
+STUDENT_IMPORT_ADMIN_MAX_ROWS = int(os.getenv('STUDENT_IMPORT_ADMIN_MAX_ROWS', '100'))
+
+# Списки админки по большим таблицам (попытки, ответы, просмотры) считают записи
+# точно только до этого числа, дальше - по оценке планировщика PostgreSQL
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('ADMIN_EXACT_COUNT_LIMIT', '10000'))
+
+# Курсов на странице каталога
+COURSE_LIST_PAGE_SIZE = int(os.getenv('COURSE_LIST_PAGE_SIZE', '12'))
+# Сколько результатов поиска показывать в каждом разделе
+SEARCH_RESULTS_LIMIT = int(os.getenv('SEARCH_RESULTS_LIMIT', '20'))
+
+# Ширины копий изображений курсов и уроков (JPEG и WebP) и ширина для src по умолчанию
+IMAGE_VARIANT_WIDTHS = tuple(int(w) for w in os.getenv('IMAGE_VARIANT_WIDTHS', '320,640,960').split(','))
+IMAGE_DEFAULT_WIDTH = int(os.getenv('IMAGE_DEFAULT_WIDTH', '640'))
+
+# Сколько запросов одновременно обрабатывает один воркер ASGI (GUNICORN_PROFILE=asgi);
+# воркеры x это значение должно быть меньше max_connections PostgreSQL
+ASGI_MAX_CONCURRENT_REQUESTS = int(os.getenv('ASGI_MAX_CONCURRENT_REQUESTS', '20'))
+
+# Отдача видео уроков: 'accel' - через nginx (X-Accel-Redirect), 'python' - самим Django
+VIDEO_DELIVERY = os.getenv('VIDEO_DELIVERY', 'python')
+# internal-локация nginx, указывающая на MEDIA_ROOT (см. geo-education.ru)
+VIDEO_ACCEL_PREFIX = os.getenv('VIDEO_ACCEL_PREFIX', '/protected-media/')
+# Размер блока при потоковой отдаче видео в режиме 'python'
+VIDEO_CHUNK_SIZE = int(os.getenv('VIDEO_CHUNK_SIZE', str(256 * 1024)))
+
 LOGIN_URL = 'courses:login'
 LOGIN_REDIRECT_URL = 'courses:course_list'
 LOGOUT_REDIRECT_URL = 'courses:index'
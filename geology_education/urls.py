@@ -3,11 +3,14 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from courses.video import serve_media
+
 urlpatterns = [
     path('admin/', admin.site.urls),               # админ-панель Django
     path('', include('courses.urls')),             # подключаем маршруты приложения courses
 ]
 
-# Добавляем обработку медиа-файлов только в режиме отладки (разработка)
+# Добавляем обработку медиа-файлов только в режиме отладки (разработка);
+# видео уроков отсюда не отдаются, только через courses:lesson_video
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
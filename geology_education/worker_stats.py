@@ -0,0 +1,50 @@
+"""
+Счётчики воркеров в общем кэше.
+
+Каждый воркер gunicorn держит свои счётчики в памяти и периодически
+сохраняет их снимок в общий кэш под своим именем (хост:pid). Список
+воркеров хранится отдельным ключом; снимки остановленных воркеров
+истекают, и при следующем чтении воркеры удаляются из списка.
+"""
+
+import os
+import socket
+import time
+
+from django.core.cache import cache
+
+
+_published_at = {}
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def publish(name, snapshot, interval, force=False):
+    """
+    Раз в interval секунд сохраняет снимок счётчиков воркера под именем
+    name; snapshot - функция, возвращающая снимок.
+    """
+    now = time.monotonic()
+    if not force and now - _published_at.get(name, 0) < interval:
+        return
+    _published_at[name] = now
+    worker = worker_name()
+    cache.set(f'{name}:{worker}', snapshot(), interval * 3)
+    workers_key = f'{name}:workers'
+    workers = cache.get(workers_key, [])
+    if worker not in workers:
+        cache.set(workers_key, workers + [worker], None)
+
+
+def collect(name):
+    """Последние снимки работающих воркеров: {воркер: снимок}."""
+    workers_key = f'{name}:workers'
+    workers = cache.get(workers_key, [])
+    values = cache.get_many([f'{name}:{worker}' for worker in workers])
+    snapshots = {worker: values[f'{name}:{worker}'] for worker in workers if f'{name}:{worker}' in values}
+    if len(snapshots) < len(workers):
+        # Остановленные воркеры больше не публикуют счётчики
+        cache.set(workers_key, list(snapshots), None)
+    return snapshots
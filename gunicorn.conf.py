@@ -1,8 +1,29 @@
 # gunicorn.conf.py
+import os
+
 bind = "127.0.0.1:8000"
 workers = 3
+
+# Профиль воркеров (переменная GUNICORN_PROFILE):
+#   wsgi - синхронные воркеры, один запрос на воркер;
+#   asgi - воркеры uvicorn, асинхронные страницы каталога и уроков не держат
+#          воркер во время запросов к БД (python manage.py loadtest для сравнения)
+if os.getenv("GUNICORN_PROFILE", "wsgi") == "asgi":
+    wsgi_app = "geology_education.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "geology_education.wsgi:application"
+    # При GUNICORN_THREADS > 1 воркеры gthread; соединения потоков берутся
+    # из общего пула воркера (DB_POOL_SIZE не меньше числа потоков)
+    threads = int(os.getenv("GUNICORN_THREADS", "1"))
 user = "www-data"
 group = "www-data"
 errorlog = "/var/log/gunicorn/error.log"
 accesslog = "/var/log/gunicorn/access.log"
-loglevel = "info"
\ No newline at end of file
+loglevel = "info"
+
+
+def worker_exit(server, worker):
+    # Записываем накопленные в буфере просмотры уроков перед остановкой воркера
+    from courses.progress import lesson_view_buffer
+    lesson_view_buffer.flush()